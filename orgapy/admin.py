@@ -6,7 +6,9 @@ admin.site.register(models.Tag)
 admin.site.register(models.Document)
 admin.site.register(models.Project)
 admin.site.register(models.Objective)
+admin.site.register(models.ObjectiveCompletion)
 admin.site.register(models.Task)
 admin.site.register(models.Calendar)
+admin.site.register(models.CalendarEvent)
 admin.site.register(models.ProgressLog)
 admin.site.register(models.MoodLog)
\ No newline at end of file
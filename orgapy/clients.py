@@ -0,0 +1,89 @@
+import contextlib
+import threading
+import time
+from typing import Iterator
+
+import caldav
+
+
+CLIENT_IDLE_TIMEOUT = 300
+CLIENT_MAX_IDLE_PER_KEY = 4
+
+
+class ClientPool:
+    """Keep CalDAV clients, and thus their HTTP sessions, alive across syncs
+    within a process. Clients are keyed by server URL and username and lent
+    to one thread at a time, since sessions are not thread-safe. Clients left
+    idle for more than `CLIENT_IDLE_TIMEOUT` seconds are closed.
+    """
+
+    def __init__(self, idle_timeout: float = CLIENT_IDLE_TIMEOUT, max_idle_per_key: int = CLIENT_MAX_IDLE_PER_KEY):
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_key = max_idle_per_key
+        self.idle: dict[tuple[str, str], list[tuple[float, str, caldav.DAVClient]]] = {}
+        self.lock = threading.Lock()
+
+    def _evict(self, now: float) -> list[caldav.DAVClient]:
+        evicted = []
+        for key in list(self.idle):
+            entries = self.idle[key]
+            kept = [entry for entry in entries if now - entry[0] <= self.idle_timeout]
+            evicted += [client for released, _, client in entries if now - released > self.idle_timeout]
+            if kept:
+                self.idle[key] = kept
+            else:
+                del self.idle[key]
+        return evicted
+
+    def _acquire(self, url: str, username: str, password: str) -> caldav.DAVClient | None:
+        with self.lock:
+            evicted = self._evict(time.monotonic())
+            client = None
+            entries = self.idle.get((url, username), [])
+            while entries and client is None:
+                _, client_password, candidate = entries.pop()
+                if client_password == password:
+                    client = candidate
+                else:
+                    evicted.append(candidate)
+        for stale in evicted:
+            stale.close()
+        return client
+
+    def _release(self, url: str, username: str, password: str, client: caldav.DAVClient):
+        with self.lock:
+            now = time.monotonic()
+            evicted = self._evict(now)
+            entries = self.idle.setdefault((url, username), [])
+            if len(entries) < self.max_idle_per_key:
+                entries.append((now, password, client))
+            else:
+                evicted.append(client)
+        for stale in evicted:
+            stale.close()
+
+    @contextlib.contextmanager
+    def client(self, url: str, username: str, password: str, timeout: int | None = None) -> Iterator[caldav.DAVClient]:
+        """Lend a client for the given server and credentials, creating it if
+        none is idle. A client whose use raised an exception is closed rather
+        than returned to the pool."""
+        client = self._acquire(url, username, password)
+        if client is None:
+            client = caldav.DAVClient(url=url, username=username, password=password, timeout=timeout)
+        client.timeout = timeout
+        try:
+            yield client
+        except BaseException:
+            client.close()
+            raise
+        self._release(url, username, password, client)
+
+    def clear(self):
+        with self.lock:
+            clients = [client for entries in self.idle.values() for _, _, client in entries]
+            self.idle.clear()
+        for client in clients:
+            client.close()
+
+
+client_pool = ClientPool()
@@ -0,0 +1,61 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from orgapy import models
+from orgapy.search import SEARCH_BACKENDS, search_documents
+
+
+WORDS = [
+    "garden", "tomato", "recipe", "project", "meeting", "travel", "budget",
+    "python", "django", "search", "index", "calendar", "music", "reading",
+    "health", "running", "painting", "family", "weekend", "holiday",
+]
+
+
+class Command(BaseCommand):
+    """Compare search backends on a generated corpus."""
+    help="Compare search backends on a generated corpus, rolled back afterwards"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", "--documents", type=int, default=5000, help="Number of documents to generate")
+        parser.add_argument("-w", "--words", type=int, default=300, help="Number of words per document")
+        parser.add_argument("-r", "--repeat", type=int, default=5, help="Number of runs per query")
+        parser.add_argument("--no-fuzzy", action="store_true", help="Disable the fuzzy fallback for queries with few matches")
+        parser.add_argument("-b", "--backend", type=str, action="append", choices=list(SEARCH_BACKENDS), help="Backend to benchmark (default: all those supported by the database)")
+
+    def _generate(self, user, count: int, length: int):
+        rng = random.Random(0)
+        models.Document.objects.bulk_create([
+            models.Document(
+                user=user,
+                nonce=f"bench{i}",
+                title=" ".join(rng.choices(WORDS, k=3)),
+                content=" ".join(rng.choices(WORDS, k=length)))
+            for i in range(count)
+        ], batch_size=500)
+
+    def handle(self, *args, **kwargs):
+        names = kwargs["backend"] or [name for name in SEARCH_BACKENDS if name in (connection.vendor, "icontains")]
+        queries = ["tomato", "gard", "python django", '"weekend holiday"', "tomatto", "gardn pyhton"]
+        with transaction.atomic():
+            user = get_user_model().objects.create(username=f"orgapy-benchmark-{time.time_ns()}")
+            start = time.perf_counter()
+            self._generate(user, kwargs["documents"], kwargs["words"])
+            self.stdout.write(f"Generated {kwargs['documents']} document(s) in {time.perf_counter() - start:.2f}s")
+            qs = models.Document.objects.filter(user=user)
+            for name in names:
+                backend = SEARCH_BACKENDS[name]()
+                for query in queries:
+                    durations = []
+                    for _ in range(kwargs["repeat"]):
+                        start = time.perf_counter()
+                        results = search_documents(qs, query, backend=backend, fuzzy=not kwargs["no_fuzzy"]).order_by("relevance", "id")
+                        count = results.count()
+                        list(results.defer("content", "config")[:20])
+                        durations.append(time.perf_counter() - start)
+                    self.stdout.write(f"{name:<12}{query:<20}{count:>8} result(s){1000 * min(durations):>10.1f}ms")
+            transaction.set_rollback(True)
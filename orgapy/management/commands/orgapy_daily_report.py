@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 
 from orgapy import models
+from orgapy.sync import sync_calendars
 
 
 class Command(BaseCommand):
@@ -18,6 +19,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
         today = timezone.now().date()
+        this_morning = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
         items = []
         for user_settings in models.Settings.objects.filter(user__username=kwargs["user"]):
             user = user_settings.user
@@ -30,17 +32,19 @@ class Command(BaseCommand):
                             "start": str(task.start_date),
                             "due": None if not task.due_date else str(task.due_date)
                         })
-            for calendar in models.Calendar.objects.filter(user=user):
-                for event in calendar.get_events(force=kwargs["update_events"]):
-                    event_start = datetime.datetime.strptime(event["dtstart"][:10], "%Y-%m-%d").date()
-                    if event_start == today:
-                        items.append({
-                            "type": "event",
-                            "label": event["title"],
-                            "start": event.get("dtstart"),
-                            "end": event.get("dtend"),
-                            "location": event.get("location")
-                        })
+            if kwargs["update_events"]:
+                sync_calendars(models.Calendar.objects.filter(user=user), force=True)
+            events = models.CalendarEvent.objects\
+                .filter(calendar__user=user, dtstart__gte=this_morning, dtstart__lt=this_morning + datetime.timedelta(days=1))\
+                .order_by("dtstart", "title")
+            for event in events:
+                items.append({
+                    "type": "event",
+                    "label": event.title,
+                    "start": (timezone.localtime(event.dtstart).date() if event.all_day else timezone.localtime(event.dtstart)).isoformat(),
+                    "end": (timezone.localtime(event.dtend).date() if event.all_day else timezone.localtime(event.dtend)).isoformat(),
+                    "location": event.location
+                })
         if kwargs["format"] == "json":
             print(json.dumps({"items": items, "count": len(items)}))
             return
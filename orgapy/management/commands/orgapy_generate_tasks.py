@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orgapy import models
+
+
+class Command(BaseCommand):
+    """Create upcoming occurrences of recurring tasks."""
+    help="Create upcoming occurrences of recurring tasks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-d", "--days", type=int, default=30, help="Number of days ahead to generate occurrences for")
+
+    def handle(self, *args, **kwargs):
+        today = timezone.now().date()
+        tasks = models.Task.objects\
+            .filter(completed=False, recurring_period__gt=0)\
+            .exclude(recurring_mode=models.Task.ONCE)
+        created = models.Task.create_upcoming_occurrences(tasks, today + datetime.timedelta(days=kwargs["days"]), today)
+        self.stdout.write(f"Created {len(created)} task(s)")
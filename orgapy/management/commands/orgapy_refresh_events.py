@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 
 from orgapy import models
+from orgapy.sync import sync_calendars
 
 
 class Command(BaseCommand):
@@ -11,5 +12,5 @@ class Command(BaseCommand):
         pass
 
     def handle(self, *args, **kwargs):
-        for calendar in models.Calendar.objects.all():
-            calendar.fetch_events()
+        successes, failures = sync_calendars(models.Calendar.objects.all(), force=True)
+        self.stdout.write(f"Refreshed {successes} calendar(s), {failures} failure(s)")
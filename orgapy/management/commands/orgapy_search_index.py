@@ -0,0 +1,133 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+
+
+# Indexes are external content FTS5 tables over `orgapy_document`: they
+# only store terms, and their `_docsize` table has one row per indexed
+# document. They are listed with the columns they index.
+FTS_INDEXES = {
+    "orgapy_document_fts": ["title", "content"],
+    "orgapy_document_title_fts": ["title"],
+}
+
+MISSING_DOCUMENTS_SQL = """
+    SELECT id FROM orgapy_document
+    WHERE id > %s AND id NOT IN (SELECT id FROM {table}_docsize)
+    ORDER BY id LIMIT %s
+"""
+
+ALL_DOCUMENTS_SQL = "SELECT id FROM orgapy_document WHERE id > %s ORDER BY id LIMIT %s"
+
+ORPHAN_ROWS_SQL = "SELECT id FROM {table}_docsize WHERE id NOT IN (SELECT id FROM orgapy_document)"
+
+
+class Command(BaseCommand):
+    """Maintain the SQLite full-text indexes of documents."""
+    help="Maintain the SQLite full-text indexes of documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", type=str, choices=["rebuild", "check", "optimize", "merge", "stats"], help="'rebuild' indexes documents missing from the index, 'check' verifies that the index matches the documents, 'optimize' merges all index segments into one, 'merge' merges segments incrementally, 'stats' reports the size of the index")
+        parser.add_argument("-i", "--index", type=str, action="append", choices=list(FTS_INDEXES), help="Index to maintain (default: all)")
+        parser.add_argument("-f", "--full", action="store_true", help="Re-index all documents, to repair an index that does not match them (rebuild)")
+        parser.add_argument("-s", "--batch-size", type=int, default=500, help="Number of documents to index per statement (rebuild)")
+        parser.add_argument("-p", "--pages", type=int, default=500, help="Number of leaf pages to merge per step (merge)")
+
+    def _count(self, sql: str, params: tuple = ()) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM ({sql})", params)
+            return cursor.fetchone()[0]
+
+    def _rebuild(self, table: str, full: bool, batch_size: int):
+        if not full and self._count(ORPHAN_ROWS_SQL.format(table=table)):
+            raise CommandError(f"{table} holds deleted documents, which can only be removed by a full rebuild")
+        select_sql = ALL_DOCUMENTS_SQL if full else MISSING_DOCUMENTS_SQL.format(table=table)
+        columns = ", ".join(FTS_INDEXES[table])
+        values = ", ".join(f"COALESCE({column}, '')" for column in FTS_INDEXES[table])
+        total, last_id = 0, 0
+        # Batches share a single transaction: documents saved meanwhile would
+        # otherwise be indexed twice, or removed from the index before being
+        # indexed. Readers still see the previous index until it commits.
+        with transaction.atomic(), connection.cursor() as cursor:
+            if full:
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('delete-all')")
+            while True:
+                cursor.execute(select_sql, [last_id, batch_size])
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    break
+                cursor.execute(
+                    f"INSERT INTO {table}(rowid, {columns}) "
+                    f"SELECT id, {values} FROM orgapy_document "
+                    f"WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                    ids)
+                total += len(ids)
+                last_id = ids[-1]
+                self.stdout.write(f"{table}: indexed {total} document(s)")
+        self.stdout.write(f"{table}: indexed {total} document(s) in total")
+
+    def _check(self, table: str):
+        missing = self._count(MISSING_DOCUMENTS_SQL.format(table=table), (0, -1))
+        if missing:
+            raise CommandError(f"{table} is missing {missing} document(s), run 'rebuild' to add them")
+        with connection.cursor() as cursor:
+            try:
+                # A rank of 1 also compares the index with the documents.
+                cursor.execute(f"INSERT INTO {table}({table}, rank) VALUES ('integrity-check', 1)")
+            except DatabaseError as err:
+                raise CommandError(f"{table} does not match documents ({err}), run 'rebuild --full' to repair it")
+        self.stdout.write(f"{table}: matches documents")
+
+    def _optimize(self, table: str):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+        self.stdout.write(f"{table}: merged all segments")
+
+    def _merge(self, table: str, pages: int):
+        raw_connection = connection.connection
+        steps = 0
+        while True:
+            before = raw_connection.total_changes
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {table}({table}, rank) VALUES ('merge', %s)", [pages])
+            steps += 1
+            # A step that changed fewer than 2 rows had nothing left to merge.
+            if raw_connection.total_changes - before < 2:
+                break
+        self.stdout.write(f"{table}: merged segments in {steps} step(s)")
+
+    def _stats(self, table: str):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM orgapy_document")
+            documents = cursor.fetchone()[0]
+            cursor.execute(f"SELECT COUNT(*) FROM {table}_docsize")
+            rows = cursor.fetchone()[0]
+            cursor.execute(f"SELECT COUNT(*), COALESCE(SUM(LENGTH(block)), 0) FROM {table}_data")
+            blocks, size = cursor.fetchone()
+            cursor.execute(f"SELECT COUNT(DISTINCT segid) FROM {table}_idx")
+            segments = cursor.fetchone()[0]
+        self.stdout.write(table)
+        self.stdout.write(f"  Documents:    {documents}")
+        self.stdout.write(f"  Indexed:      {rows}")
+        self.stdout.write(f"  Segments:     {segments}")
+        self.stdout.write(f"  Size:         {size / 1024:.1f} KiB in {blocks} block(s)")
+
+    def handle(self, *args, **kwargs):
+        if connection.vendor != "sqlite":
+            raise CommandError("Only the SQLite indexes need maintenance, PostgreSQL keeps its search vector up to date")
+        connection.ensure_connection()
+        action = kwargs["action"]
+        for table in kwargs["index"] or FTS_INDEXES:
+            if action == "rebuild":
+                self._rebuild(table, kwargs["full"], kwargs["batch_size"])
+            elif action == "check":
+                self._check(table)
+            elif action == "optimize":
+                self._optimize(table)
+            elif action == "merge":
+                self._merge(table, kwargs["pages"])
+            elif action == "stats":
+                self._stats(table)
+        if action == "optimize":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE orgapy_document")
+            self.stdout.write("Refreshed planner statistics")
@@ -1,5 +1,7 @@
 from django.db import migrations
 
+from orgapy.operations import RunSQLForVendor
+
 class Migration(migrations.Migration):
 
     dependencies = [
@@ -7,7 +9,8 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 CREATE VIRTUAL TABLE orgapy_document_fts USING fts5(
                     title,
@@ -19,7 +22,8 @@ class Migration(migrations.Migration):
             reverse_sql="DROP TABLE orgapy_document_fts;",
         ),
 
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 CREATE TRIGGER document_ai AFTER INSERT ON orgapy_document BEGIN
                   INSERT INTO orgapy_document_fts(rowid, title, content)
@@ -29,7 +33,8 @@ class Migration(migrations.Migration):
             reverse_sql="DROP TRIGGER document_ai;",
         ),
 
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 CREATE TRIGGER document_ad AFTER DELETE ON orgapy_document BEGIN
                   INSERT INTO orgapy_document_fts(orgapy_document_fts, rowid, title, content)
@@ -39,7 +44,8 @@ class Migration(migrations.Migration):
             reverse_sql="DROP TRIGGER document_ad;",
         ),
 
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 CREATE TRIGGER document_au AFTER UPDATE ON orgapy_document BEGIN
                   INSERT INTO orgapy_document_fts(orgapy_document_fts, rowid, title, content)
@@ -51,7 +57,8 @@ class Migration(migrations.Migration):
             reverse_sql="DROP TRIGGER document_au;",
         ),
 
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 INSERT INTO orgapy_document_fts(rowid, title, content)
                 SELECT id, title, content FROM orgapy_document;
@@ -1,5 +1,7 @@
 from django.db import migrations
 
+from orgapy.operations import RunSQLForVendor
+
 
 class Migration(migrations.Migration):
 
@@ -10,7 +12,8 @@ class Migration(migrations.Migration):
     operations = [
 
         # --- Drop old triggers ---
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 DROP TRIGGER IF EXISTS document_ai;
                 DROP TRIGGER IF EXISTS document_ad;
@@ -20,7 +23,8 @@ class Migration(migrations.Migration):
         ),
 
         # --- Recreate INSERT trigger ---
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 CREATE TRIGGER document_ai
                 AFTER INSERT ON orgapy_document
@@ -37,7 +41,8 @@ class Migration(migrations.Migration):
         ),
 
         # --- Recreate DELETE trigger ---
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 CREATE TRIGGER document_ad
                 AFTER DELETE ON orgapy_document
@@ -50,7 +55,8 @@ class Migration(migrations.Migration):
         ),
 
         # --- Recreate UPDATE trigger (only when relevant fields change) ---
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 CREATE TRIGGER document_au
                 AFTER UPDATE OF title, content ON orgapy_document
@@ -70,7 +76,8 @@ class Migration(migrations.Migration):
         ),
 
         # --- Rebuild FTS index to fix existing corruption ---
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 INSERT INTO orgapy_document_fts(orgapy_document_fts)
                 VALUES ('rebuild');
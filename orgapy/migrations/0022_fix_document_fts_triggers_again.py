@@ -1,5 +1,7 @@
 from django.db import migrations
 
+from orgapy.operations import RunSQLForVendor
+
 
 class Migration(migrations.Migration):
 
@@ -10,12 +12,13 @@ class Migration(migrations.Migration):
     operations = [
 
         # --- Drop triggers individually ---
-        migrations.RunSQL("DROP TRIGGER IF EXISTS document_ai;", reverse_sql=migrations.RunSQL.noop),
-        migrations.RunSQL("DROP TRIGGER IF EXISTS document_ad;", reverse_sql=migrations.RunSQL.noop),
-        migrations.RunSQL("DROP TRIGGER IF EXISTS document_au;", reverse_sql=migrations.RunSQL.noop),
+        RunSQLForVendor("sqlite", "DROP TRIGGER IF EXISTS document_ai;", reverse_sql=migrations.RunSQL.noop),
+        RunSQLForVendor("sqlite", "DROP TRIGGER IF EXISTS document_ad;", reverse_sql=migrations.RunSQL.noop),
+        RunSQLForVendor("sqlite", "DROP TRIGGER IF EXISTS document_au;", reverse_sql=migrations.RunSQL.noop),
 
         # --- INSERT trigger ---
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 CREATE TRIGGER document_ai
                 AFTER INSERT ON orgapy_document
@@ -32,7 +35,8 @@ class Migration(migrations.Migration):
         ),
 
         # --- DELETE trigger ---
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 CREATE TRIGGER document_ad
                 AFTER DELETE ON orgapy_document
@@ -45,7 +49,8 @@ class Migration(migrations.Migration):
         ),
 
         # --- UPDATE trigger ---
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="""
                 CREATE TRIGGER document_au
                 AFTER UPDATE OF title, content ON orgapy_document
@@ -65,7 +70,8 @@ class Migration(migrations.Migration):
         ),
 
         # --- Rebuild index ---
-        migrations.RunSQL(
+        RunSQLForVendor(
+            "sqlite",
             sql="INSERT INTO orgapy_document_fts(orgapy_document_fts) VALUES ('rebuild');",
             reverse_sql=migrations.RunSQL.noop,
         ),
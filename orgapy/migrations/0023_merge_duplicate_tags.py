@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    Tag = apps.get_model("orgapy", "Tag")
+
+    db_alias = schema_editor.connection.alias
+
+    kept: dict[tuple[int, str], object] = {}
+    for tag in Tag.objects.using(db_alias).all().order_by("id"):
+        key = (tag.user_id, tag.name)
+        if key not in kept:
+            kept[key] = tag
+            continue
+        kept[key].documents.add(*tag.documents.all())
+        tag.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgapy', '0022_fix_document_fts_triggers_again'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, reverse_code=migrations.RunPython.noop),
+    ]
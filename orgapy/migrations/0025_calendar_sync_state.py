@@ -0,0 +1,23 @@
+# Generated by Django 6.1.2 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgapy', '0024_tag_unique_user_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendar',
+            name='last_sync_attempt',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='calendar',
+            name='sync_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgapy', '0025_calendar_sync_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendar',
+            name='calendar_url',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='calendar',
+            name='ctag',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='calendar',
+            name='sync_token',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='calendar',
+            name='synced_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
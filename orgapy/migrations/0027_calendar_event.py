@@ -0,0 +1,66 @@
+# Generated by Django 6.1.2 on 2026-10-18 13:14
+
+import datetime
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _as_datetime(value: str) -> datetime.datetime:
+    dt = datetime.datetime.fromisoformat(value)
+    return timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+
+
+def copy_events(apps, schema_editor):
+    Calendar = apps.get_model("orgapy", "Calendar")
+    CalendarEvent = apps.get_model("orgapy", "CalendarEvent")
+
+    db_alias = schema_editor.connection.alias
+
+    events = []
+    for calendar in Calendar.objects.using(db_alias).exclude(events=None):
+        for event in json.loads(calendar.events or "[]"):
+            events.append(CalendarEvent(
+                calendar=calendar,
+                url=event["url"],
+                title=event["title"],
+                location=event["location"],
+                dtstart=_as_datetime(event["dtstart"]),
+                dtend=_as_datetime(event["dtend"]),
+                all_day=len(event["dtstart"]) < 11))
+    CalendarEvent.objects.using(db_alias).bulk_create(events, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgapy', '0026_calendar_incremental_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('url', models.CharField(max_length=512)),
+                ('uid', models.TextField(blank=True)),
+                ('title', models.TextField()),
+                ('location', models.TextField(blank=True, null=True)),
+                ('dtstart', models.DateTimeField()),
+                ('dtend', models.DateTimeField()),
+                ('all_day', models.BooleanField(default=False)),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='orgapy.calendar')),
+            ],
+            options={
+                'ordering': ['dtstart', 'title'],
+                'indexes': [models.Index(fields=['calendar', 'dtstart'], name='orgapy_event_calendar_start'), models.Index(fields=['calendar', 'url'], name='orgapy_event_calendar_url')],
+            },
+        ),
+        migrations.RunPython(copy_events, reverse_code=migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='calendar',
+            name='events',
+        ),
+    ]
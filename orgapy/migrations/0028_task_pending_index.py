@@ -0,0 +1,19 @@
+# Generated by Django 6.1.2 on 2026-10-18 13:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgapy', '0027_calendar_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'completed', 'start_date', 'due_date'], name='orgapy_task_user_pending'),
+        ),
+    ]
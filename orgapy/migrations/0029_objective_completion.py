@@ -0,0 +1,63 @@
+# Generated by Django 6.1.2 on 2026-10-18 13:48
+
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_history(apps, schema_editor):
+    Objective = apps.get_model("orgapy", "Objective")
+    ObjectiveCompletion = apps.get_model("orgapy", "ObjectiveCompletion")
+
+    db_alias = schema_editor.connection.alias
+
+    completions = []
+    for objective in Objective.objects.using(db_alias).exclude(history=None).exclude(history=""):
+        try:
+            history = json.loads(objective.history)
+        except ValueError:
+            continue
+        for ts in history:
+            completions.append(ObjectiveCompletion(objective=objective, ts=int(ts)))
+    ObjectiveCompletion.objects.using(db_alias).bulk_create(completions, batch_size=1000)
+
+
+def restore_history(apps, schema_editor):
+    Objective = apps.get_model("orgapy", "Objective")
+    ObjectiveCompletion = apps.get_model("orgapy", "ObjectiveCompletion")
+
+    db_alias = schema_editor.connection.alias
+
+    history = {}
+    for objective_id, ts in ObjectiveCompletion.objects.using(db_alias).order_by("objective_id", "ts").values_list("objective_id", "ts"):
+        history.setdefault(objective_id, []).append(ts)
+    for objective_id, timestamps in history.items():
+        Objective.objects.using(db_alias).filter(id=objective_id).update(history=json.dumps(timestamps))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgapy', '0028_task_pending_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ObjectiveCompletion',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('ts', models.BigIntegerField()),
+                ('objective', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='orgapy.objective')),
+            ],
+            options={
+                'ordering': ['ts'],
+                'indexes': [models.Index(fields=['objective', 'ts'], name='orgapy_completion_ts')],
+            },
+        ),
+        migrations.RunPython(copy_history, reverse_code=restore_history),
+        migrations.RemoveField(
+            model_name='objective',
+            name='history',
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.1.2 on 2026-10-18 13:52
+
+import re
+
+from django.db import migrations, models
+
+
+def count_items(apps, schema_editor):
+    Project = apps.get_model("orgapy", "Project")
+
+    db_alias = schema_editor.connection.alias
+
+    projects = []
+    for project in Project.objects.using(db_alias).exclude(checklist=None).only("id", "checklist"):
+        states = re.findall(r"^\[([ x])\]", project.checklist, re.MULTILINE)
+        project.items_count = len(states)
+        project.completed_items_count = states.count("x")
+        projects.append(project)
+    Project.objects.using(db_alias).bulk_update(projects, ["items_count", "completed_items_count"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgapy', '0029_objective_completion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='completed_items_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_items, reverse_code=migrations.RunPython.noop),
+    ]
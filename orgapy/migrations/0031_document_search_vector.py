@@ -0,0 +1,45 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+import orgapy.models
+from orgapy.operations import RunSQLForVendor
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgapy', '0030_project_checklist_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentIndex',
+            fields=[
+                ('document', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='index', serialize=False, to='orgapy.document')),
+                ('title', models.TextField()),
+                ('content', models.TextField()),
+                ('fts', orgapy.models.FullTextField(db_column='orgapy_document_fts')),
+                ('rank', orgapy.models.FullTextRankField()),
+            ],
+            options={
+                'db_table': 'orgapy_document_fts',
+                'managed': False,
+            },
+        ),
+        RunSQLForVendor(
+            "postgresql",
+            sql="""
+                ALTER TABLE orgapy_document ADD COLUMN search_vector tsvector
+                GENERATED ALWAYS AS (
+                    setweight(to_tsvector('simple', COALESCE(title, '')), 'A') ||
+                    setweight(to_tsvector('simple', COALESCE(content, '')), 'B')
+                ) STORED;
+            """,
+            reverse_sql="ALTER TABLE orgapy_document DROP COLUMN search_vector;",
+        ),
+        RunSQLForVendor(
+            "postgresql",
+            sql="CREATE INDEX orgapy_document_search_vector ON orgapy_document USING GIN (search_vector);",
+            reverse_sql="DROP INDEX orgapy_document_search_vector;",
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 6.1.2 on 2026-10-18 14:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+from orgapy.operations import RunSQLForVendor
+
+
+# SQLite adds the columns by rebuilding the tables, which drops the
+# full-text index triggers of the documents table, so they are created
+# again afterwards, in either direction.
+DOCUMENT_FTS_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS document_ai;",
+    "DROP TRIGGER IF EXISTS document_ad;",
+    "DROP TRIGGER IF EXISTS document_au;",
+    """
+    CREATE TRIGGER document_ai
+    AFTER INSERT ON orgapy_document
+    BEGIN
+      INSERT INTO orgapy_document_fts(rowid, title, content)
+      VALUES (new.id, COALESCE(new.title, ''), COALESCE(new.content, ''));
+    END;
+    """,
+    """
+    CREATE TRIGGER document_ad
+    AFTER DELETE ON orgapy_document
+    BEGIN
+      INSERT INTO orgapy_document_fts(orgapy_document_fts, rowid)
+      VALUES ('delete', old.id);
+    END;
+    """,
+    """
+    CREATE TRIGGER document_au
+    AFTER UPDATE OF title, content ON orgapy_document
+    BEGIN
+      INSERT INTO orgapy_document_fts(orgapy_document_fts, rowid)
+      VALUES ('delete', old.id);
+      INSERT INTO orgapy_document_fts(rowid, title, content)
+      VALUES (new.id, COALESCE(new.title, ''), COALESCE(new.content, ''));
+    END;
+    """,
+]
+
+
+def fill_title_keys(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+
+    for model_name in ["Document", "Project"]:
+        Model = apps.get_model("orgapy", model_name)
+        objects = []
+        for obj in Model.objects.using(db_alias).exclude(title=None).only("id", "title"):
+            obj.title_key = obj.title.strip().lower()[:255]
+            objects.append(obj)
+        Model.objects.using(db_alias).bulk_update(objects, ["title_key"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgapy', '0031_document_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        RunSQLForVendor("sqlite", sql=migrations.RunSQL.noop, reverse_sql=DOCUMENT_FTS_TRIGGERS),
+        migrations.AddField(
+            model_name='document',
+            name='title_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='title_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        RunSQLForVendor("sqlite", sql=DOCUMENT_FTS_TRIGGERS, reverse_sql=migrations.RunSQL.noop),
+        migrations.RunPython(fill_title_keys, reverse_code=migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['user', 'title_key'], name='orgapy_document_title_key'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['user', 'title_key'], name='orgapy_project_title_key'),
+        ),
+    ]
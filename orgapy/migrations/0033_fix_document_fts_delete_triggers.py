@@ -0,0 +1,51 @@
+from django.db import migrations
+
+from orgapy.operations import RunSQLForVendor
+
+
+# The index is an external content FTS5 table: deleting an entry requires
+# the values that were indexed, otherwise the previous terms of a document
+# stay in the index and it no longer matches the documents table. The
+# fixed triggers are kept when migrating backwards.
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgapy', '0032_title_key'),
+    ]
+
+    operations = [
+        RunSQLForVendor("sqlite", "DROP TRIGGER IF EXISTS document_ad;", reverse_sql=migrations.RunSQL.noop),
+        RunSQLForVendor("sqlite", "DROP TRIGGER IF EXISTS document_au;", reverse_sql=migrations.RunSQL.noop),
+        RunSQLForVendor(
+            "sqlite",
+            sql="""
+                CREATE TRIGGER document_ad
+                AFTER DELETE ON orgapy_document
+                BEGIN
+                  INSERT INTO orgapy_document_fts(orgapy_document_fts, rowid, title, content)
+                  VALUES ('delete', old.id, COALESCE(old.title, ''), COALESCE(old.content, ''));
+                END;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        RunSQLForVendor(
+            "sqlite",
+            sql="""
+                CREATE TRIGGER document_au
+                AFTER UPDATE OF title, content ON orgapy_document
+                BEGIN
+                  INSERT INTO orgapy_document_fts(orgapy_document_fts, rowid, title, content)
+                  VALUES ('delete', old.id, COALESCE(old.title, ''), COALESCE(old.content, ''));
+                  INSERT INTO orgapy_document_fts(rowid, title, content)
+                  VALUES (new.id, COALESCE(new.title, ''), COALESCE(new.content, ''));
+                END;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        RunSQLForVendor(
+            "sqlite",
+            sql="INSERT INTO orgapy_document_fts(orgapy_document_fts) VALUES ('rebuild');",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,97 @@
+from django.db import migrations, models
+
+import orgapy.models
+from orgapy.operations import RunSQLForVendor
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgapy', '0033_fix_document_fts_delete_triggers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentTitleIndex',
+            fields=[
+                ('rowid', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('document', orgapy.models.FullTextRelation(related_name='title_index', to='orgapy.document')),
+                ('title', models.TextField()),
+                ('fts', orgapy.models.FullTextField(db_column='orgapy_document_title_fts')),
+                ('rank', orgapy.models.FullTextRankField()),
+            ],
+            options={
+                'db_table': 'orgapy_document_title_fts',
+                'managed': False,
+            },
+        ),
+
+        # --- SQLite: trigram index of titles ---
+        RunSQLForVendor(
+            "sqlite",
+            sql="""
+                CREATE VIRTUAL TABLE orgapy_document_title_fts USING fts5(
+                    title,
+                    content='orgapy_document',
+                    content_rowid='id',
+                    tokenize='trigram'
+                );
+            """,
+            reverse_sql="DROP TABLE orgapy_document_title_fts;",
+        ),
+        RunSQLForVendor(
+            "sqlite",
+            sql="""
+                CREATE TRIGGER document_title_ai
+                AFTER INSERT ON orgapy_document
+                BEGIN
+                  INSERT INTO orgapy_document_title_fts(rowid, title)
+                  VALUES (new.id, COALESCE(new.title, ''));
+                END;
+            """,
+            reverse_sql="DROP TRIGGER document_title_ai;",
+        ),
+        RunSQLForVendor(
+            "sqlite",
+            sql="""
+                CREATE TRIGGER document_title_ad
+                AFTER DELETE ON orgapy_document
+                BEGIN
+                  INSERT INTO orgapy_document_title_fts(orgapy_document_title_fts, rowid, title)
+                  VALUES ('delete', old.id, COALESCE(old.title, ''));
+                END;
+            """,
+            reverse_sql="DROP TRIGGER document_title_ad;",
+        ),
+        RunSQLForVendor(
+            "sqlite",
+            sql="""
+                CREATE TRIGGER document_title_au
+                AFTER UPDATE OF title ON orgapy_document
+                BEGIN
+                  INSERT INTO orgapy_document_title_fts(orgapy_document_title_fts, rowid, title)
+                  VALUES ('delete', old.id, COALESCE(old.title, ''));
+                  INSERT INTO orgapy_document_title_fts(rowid, title)
+                  VALUES (new.id, COALESCE(new.title, ''));
+                END;
+            """,
+            reverse_sql="DROP TRIGGER document_title_au;",
+        ),
+        RunSQLForVendor(
+            "sqlite",
+            sql="INSERT INTO orgapy_document_title_fts(orgapy_document_title_fts) VALUES ('rebuild');",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+
+        # --- PostgreSQL: trigram index of titles ---
+        RunSQLForVendor(
+            "postgresql",
+            sql="CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        RunSQLForVendor(
+            "postgresql",
+            sql="CREATE INDEX orgapy_document_title_trgm ON orgapy_document USING GIN (title gin_trgm_ops);",
+            reverse_sql="DROP INDEX orgapy_document_title_trgm;",
+        ),
+    ]
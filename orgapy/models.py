@@ -2,31 +2,79 @@ import datetime
 import hashlib
 import json
 import random
-import re
+import threading
+from functools import cached_property
 from math import ceil
+from typing import Iterable
 
 import caldav
+import recurring_ical_events
+from caldav.elements import dav
+from caldav.elements.base import BaseElement
+from caldav.lib.error import DAVError, NotFoundError
 from dateutil.relativedelta import relativedelta
-from django.db import models, OperationalError
+from django.db import models, transaction, IntegrityError
+from django.db.models.expressions import Col
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.db.models.lookups import Exact
 from django.conf import settings
 from django.urls import reverse
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .clients import client_pool
+from .suggestions import TITLE_KEY_LENGTH, get_title_key, suggestion_cache
+from .utils import CHECKLIST_ITEM_PATTERN
+
 
 NONCE_TOKENS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
 NONCE_LENGTH = 4
+NONCE_MAX_LENGTH = 12
+NONCE_BATCH_SIZE = 32
+NONCE_MAX_BATCH_SIZE = 500
+NONCE_MIN_FREE_RATIO = 0.5
+NONCE_INSERT_ATTEMPTS = 5
+
+
+class NonceAllocator:
+    """Hand out document nonces from a pool of candidates checked for
+    availability in batches, with one `nonce__in` query per batch. When too
+    many candidates of a batch are taken, the nonce space is considered
+    crowded and the length of subsequent nonces is increased.
+
+    A pooled nonce may still be taken by a concurrent insert; `Document.save`
+    handles this by retrying with a new nonce.
+    """
+
+    def __init__(self):
+        self.length = NONCE_LENGTH
+        self.pool: list[str] = []
+        self.lock = threading.Lock()
+
+    def _refill(self, count: int):
+        while len(self.pool) < count:
+            size = min(count - len(self.pool) + NONCE_BATCH_SIZE, NONCE_MAX_BATCH_SIZE)
+            candidates = set("".join(random.choices(NONCE_TOKENS, k=self.length)) for _ in range(size))
+            candidates.difference_update(self.pool)
+            taken = set(Document.objects.filter(nonce__in=candidates).order_by().values_list("nonce", flat=True))
+            free = candidates - taken
+            if len(free) < NONCE_MIN_FREE_RATIO * size and self.length < NONCE_MAX_LENGTH:
+                self.length += 1
+            self.pool.extend(free)
+
+    def allocate(self, count: int = 1) -> list[str]:
+        with self.lock:
+            self._refill(count)
+            nonces = self.pool[:count]
+            del self.pool[:count]
+        return nonces
+
+
+nonce_allocator = NonceAllocator()
 
 
 def generate_document_nonce() -> str:
-    while True:
-        nonce = "".join(random.choices(NONCE_TOKENS, k=NONCE_LENGTH))
-        try:
-            Document.objects.get(nonce=nonce)
-        except Document.DoesNotExist:
-            return nonce
-        except OperationalError:
-            return nonce
+    return nonce_allocator.allocate()[0]
 
 
 class Settings(models.Model):
@@ -74,6 +122,9 @@ class Tag(models.Model):
     class Meta:
 
         ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "name"], name="orgapy_tag_unique_user_name"),
+        ]
 
     def __str__(self):
         return f"{ self.user } - { self.name }"
@@ -83,6 +134,8 @@ class Tag(models.Model):
 
     @property
     def count(self) -> int:
+        if hasattr(self, "document_count"):
+            return self.document_count # type: ignore
         return self.documents.count() # type: ignore
 
     @property
@@ -117,16 +170,38 @@ class Document(models.Model):
     references = models.ManyToManyField("Document", blank=True, related_name="referenced_in")
     tags = models.ManyToManyField("Tag", blank=True, related_name="documents")
     title = models.CharField(max_length=255, blank=True, null=True)
+    title_key = models.CharField(max_length=TITLE_KEY_LENGTH, blank=True, default="", editable=False)
     subtitle = models.TextField(blank=True, null=True)
     content = models.TextField(blank=True, null=True)
     config = models.TextField(blank=True, null=True)
 
     class Meta:
         ordering = ["-date_modification"]
+        indexes = [
+            models.Index(fields=["user", "title_key"], name="orgapy_document_title_key"),
+        ]
 
     def __str__(self):
         return f"[{self.user}] {self.id}. {self.title}"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "title" in update_fields:
+            self.title_key = get_title_key(self.title)
+            if update_fields is not None:
+                kwargs["update_fields"] = [*update_fields, "title_key"]
+        suggestion_cache.invalidate(self.user_id)
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        for attempt in range(NONCE_INSERT_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == NONCE_INSERT_ATTEMPTS - 1 or not Document.objects.filter(nonce=self.nonce).exists():
+                    raise
+                self.nonce = generate_document_nonce()
+
     def get_absolute_url(self):
         return reverse(f"orgapy:document", args=[self.nonce])
 
@@ -167,12 +242,104 @@ class Document(models.Model):
         return hashlib.sha256(f"{self.nonce}:{self.updated_at.timestamp()}".encode()).hexdigest()
 
 
+class FullTextMatch(models.Lookup):
+    """SQLite `MATCH` operator, for full-text queries on FTS5 tables."""
+
+    lookup_name = "match"
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", [*lhs_params, *rhs_params]
+
+
+class FullTextField(models.TextField):
+    pass
+
+
+class FullTextRankField(models.FloatField):
+    pass
+
+
+FullTextField.register_lookup(FullTextMatch)
+FullTextRankField.register_lookup(FullTextMatch)
+
+
+class FullTextRelation(models.ForeignObject):
+    """Relation from an FTS5 index to the documents it indexes, by rowid.
+
+    The rowid of the index is offset by zero in the join condition, so that
+    SQLite cannot look the index up once per document: it has to scan the
+    matches of the index and look each document up by primary key. Without
+    planner statistics, it would otherwise favour the former as soon as
+    documents are filtered by an indexed column, such as their user.
+    """
+
+    def __init__(self, to, **kwargs):
+        kwargs.update(from_fields=["rowid"], to_fields=["id"], on_delete=models.DO_NOTHING)
+        super().__init__(to, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        for key in ["from_fields", "to_fields", "on_delete"]:
+            kwargs.pop(key, None)
+        return name, path, args, kwargs
+
+    def get_joining_fields(self, reverse_join=False):
+        return ()
+
+    def get_reverse_joining_fields(self):
+        return ()
+
+    def get_extra_restriction(self, alias, related_alias):
+        document_id = Col(alias, self.foreign_related_fields[0])
+        rowid = Col(related_alias, self.local_related_fields[0])
+        return Exact(document_id, rowid + 0)
+
+
+class DocumentIndex(models.Model):
+    """FTS5 index of documents, kept up to date by triggers (SQLite only).
+
+    Mapping it lets searches join it to documents. `fts` is the hidden
+    column named after the table, to match a query against all columns, and
+    `rank` is the relevance of a match (lower is better), whose function can
+    be set per query by matching it against e.g. `bm25(10, 1)`.
+    """
+
+    rowid = models.BigIntegerField(primary_key=True)
+    document = FullTextRelation(Document, related_name="index")
+    title = models.TextField()
+    content = models.TextField()
+    fts = FullTextField(db_column="orgapy_document_fts")
+    rank = FullTextRankField()
+
+    class Meta:
+        managed = False
+        db_table = "orgapy_document_fts"
+
+
+class DocumentTitleIndex(models.Model):
+    """FTS5 trigram index of document titles, kept up to date by triggers
+    (SQLite only). It matches any substring of at least three characters,
+    which lets searches find titles despite typos."""
+
+    rowid = models.BigIntegerField(primary_key=True)
+    document = FullTextRelation(Document, related_name="title_index")
+    title = models.TextField()
+    fts = FullTextField(db_column="orgapy_document_title_fts")
+    rank = FullTextRankField()
+
+    class Meta:
+        managed = False
+        db_table = "orgapy_document_title_fts"
+
+
 class Objective(models.Model):
 
     id = models.BigAutoField(primary_key=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
-    history = models.TextField(blank=True, null=True)
     period = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1), MaxValueValidator(365)])
     flexible = models.BooleanField(default=False)
     archived = models.BooleanField(default=False)
@@ -186,32 +353,40 @@ class Objective(models.Model):
     
     def get_absolute_url(self):
         return reverse("orgapy:objective", args=[self.id])
-    
+
     def to_dict(self):
-        history_dict = None
-        if self.history is not None:
-            try:
-                history_dict = json.loads(self.history)
-            except:
-                history_dict = None
         return {
             "name": self.name,
-            "history": history_dict,
             "period": self.period,
             "flexible": self.flexible,
             "archived": self.archived,
             "url": self.get_absolute_url()
         }
 
-    @property
+    @cached_property
     def completions(self) -> list[tuple[int, datetime.datetime]]:
-        if not self.history:
-            return []
         return [
             (timestamp, datetime.datetime.fromtimestamp(timestamp))
-            for timestamp in reversed(json.loads(self.history))
+            for timestamp in self.objectivecompletion_set.order_by("-ts").values_list("ts", flat=True)
+        ]
+
+
+class ObjectiveCompletion(models.Model):
+
+    id = models.BigAutoField(primary_key=True)
+    objective = models.ForeignKey(Objective, on_delete=models.CASCADE)
+    ts = models.BigIntegerField()
+
+    class Meta:
+
+        ordering = ["ts"]
+        indexes = [
+            models.Index(fields=["objective", "ts"], name="orgapy_completion_ts"),
         ]
 
+    def __str__(self):
+        return f"{ self.objective } - { self.ts }"
+
 
 class Task(models.Model):
 
@@ -262,6 +437,9 @@ class Task(models.Model):
     class Meta:
 
         ordering = ["-start_date"]
+        indexes = [
+            models.Index(fields=["user", "completed", "start_date", "due_date"], name="orgapy_task_user_pending"),
+        ]
 
     def __str__(self):
         return f"{ self.user} - { self.id }. { self.title }"
@@ -271,72 +449,150 @@ class Task(models.Model):
         if self.due_date is None:
             return False
         return timezone.now().date() > self.due_date
-    
-    def get_group(self, today: datetime.date) -> int:
-        if self.due_date is None:
-            return self.NODATE
+
+    @classmethod
+    def get_group_limits(cls, today: datetime.date) -> list[datetime.date]:
+        """Exclusive upper bounds of the due date for groups `TODAY` to
+        `NEXTMONTH`, in group order."""
         limit_today = today + datetime.timedelta(days=1)
-        if self.due_date < limit_today:
-            return self.TODAY
         limit_tomorrow = limit_today + datetime.timedelta(days=1)
-        if self.due_date < limit_tomorrow:
-            return self.TOMORROW
         limit_thisweek = limit_today + datetime.timedelta(days=6 - today.weekday())
-        if self.due_date < limit_thisweek:
-            return self.THISWEEK
         limit_nextweek = limit_thisweek + datetime.timedelta(days=7)
-        if self.due_date < limit_nextweek:
-            return self.NEXTWEEK
         dt = today + relativedelta(months=1)
         limit_thismonth = datetime.date(dt.year, dt.month, 1)
-        if self.due_date < limit_thismonth:
-            return self.THISMONTH
         limit_nextmonth = limit_thismonth + relativedelta(months=1)
-        if self.due_date < limit_nextmonth:
-            return self.NEXTMONTH
+        return [limit_today, limit_tomorrow, limit_thisweek, limit_nextweek, limit_thismonth, limit_nextmonth]
+
+    @classmethod
+    def get_group_expression(cls, today: datetime.date) -> models.Case:
+        """SQL counterpart of `get_group`, to annotate a queryset with."""
+        return models.Case(
+            models.When(due_date__isnull=True, then=models.Value(cls.NODATE)),
+            *[
+                models.When(due_date__lt=limit, then=models.Value(group))
+                for group, limit in enumerate(cls.get_group_limits(today))
+            ],
+            default=models.Value(cls.LATER),
+            output_field=models.IntegerField(),
+        )
+
+    def get_group(self, today: datetime.date) -> int:
+        if self.due_date is None:
+            return self.NODATE
+        for group, limit in enumerate(self.get_group_limits(today)):
+            if self.due_date < limit:
+                return group
         return self.LATER
 
-    def create_recurring_child(self):
-        if self.recurring_mode == Task.ONCE or self.recurring_period is None:
-            return
-        delta = None
+    def get_recurring_step(self) -> tuple[int, int] | None:
+        """Recurrence period as a number of days and a number of months, or
+        None if the task does not recur."""
+        if not self.recurring_period:
+            return None
         if self.recurring_mode == Task.DAILY:
-            delta = datetime.timedelta(days=self.recurring_period)
-        elif self.recurring_mode == Task.WEEKLY:
-            delta = datetime.timedelta(weeks=self.recurring_period)
-        elif self.recurring_mode == Task.MONTHLY:
-            delta = relativedelta(months=self.recurring_period)
-        elif self.recurring_mode == Task.YEARLY:
-            delta = relativedelta(years=self.recurring_period)
+            return self.recurring_period, 0
+        if self.recurring_mode == Task.WEEKLY:
+            return 7 * self.recurring_period, 0
+        if self.recurring_mode == Task.MONTHLY:
+            return 0, self.recurring_period
+        if self.recurring_mode == Task.YEARLY:
+            return 0, 12 * self.recurring_period
+        return None
+
+    def get_occurrence(self, count: int) -> tuple[datetime.date, datetime.date | None]:
+        """Start and due dates of the `count`-th occurrence after this one."""
+        days, months = self.get_recurring_step()
+        delta = relativedelta(days=count * days, months=count * months)
+        due_date = None if self.due_date is None else self.due_date + delta
+        return self.start_date + delta, due_date
+
+    def get_next_occurrence_count(self, today: datetime.date) -> int:
+        """Smallest positive count whose occurrence starts on or after
+        `today`, computed without stepping through the skipped periods."""
+        days, months = self.get_recurring_step()
+        if days:
+            count = ceil((today - self.start_date).days / days)
         else:
-            return
-        print("Delta:", delta)
-        due_date = self.due_date
-        start_date = self.start_date
-        today = datetime.datetime.now().date()
-        while self.recurring_period: # avoid infinite loop if recurring period is zero
-            start_date += delta
-            if due_date is not None:
-                due_date += delta
-            if start_date >= today:
-                break
-        print("Start date:", start_date)
-        print("Due date:", due_date)
-        child = Task.objects.create(
+            elapsed = 12 * (today.year - self.start_date.year) + today.month - self.start_date.month
+            count = ceil(elapsed / months)
+            if self.start_date + relativedelta(months=count * months) < today:
+                count += 1
+        return max(1, count)
+
+    def create_recurring_child(self, today: datetime.date | None = None) -> "Task | None":
+        """Create the next occurrence starting on or after today, unless it
+        was already generated."""
+        if self.get_recurring_step() is None:
+            return None
+        if today is None:
+            today = timezone.now().date()
+        start_date, due_date = self.get_occurrence(self.get_next_occurrence_count(today))
+        parent = self if self.recurring_parent is None else self.recurring_parent
+        if Task.objects.filter(recurring_parent=parent, start_date=start_date).exists():
+            return None
+        return Task.objects.create(
             user=self.user,
             title=self.title,
             start_date=start_date,
             due_date=due_date,
             recurring_mode=self.recurring_mode,
             recurring_period=self.recurring_period,
-            recurring_parent=self if self.recurring_parent is None else self.recurring_parent,
+            recurring_parent=parent,
         )
-        print("Child:", child)
-    
+
+    @classmethod
+    def create_upcoming_occurrences(cls, tasks: Iterable["Task"], until: datetime.date, today: datetime.date | None = None) -> list["Task"]:
+        """Create the occurrences of the given recurring tasks that start
+        between today and `until`, skipping those that already exist. Each
+        series is extended from its latest task among `tasks`."""
+        if today is None:
+            today = timezone.now().date()
+        latest: dict[int, Task] = {}
+        for task in tasks:
+            if task.get_recurring_step() is None:
+                continue
+            parent_id = task.id if task.recurring_parent_id is None else task.recurring_parent_id
+            if parent_id not in latest or latest[parent_id].start_date < task.start_date:
+                latest[parent_id] = task
+        if not latest:
+            return []
+        existing = set(cls.objects\
+            .filter(models.Q(id__in=latest) | models.Q(recurring_parent_id__in=latest), start_date__gte=today)\
+            .annotate(parent_id=Coalesce("recurring_parent_id", "id"))\
+            .values_list("parent_id", "start_date"))
+        children = []
+        for parent_id, task in latest.items():
+            count = task.get_next_occurrence_count(today)
+            start_date, due_date = task.get_occurrence(count)
+            while start_date <= until:
+                if (parent_id, start_date) not in existing:
+                    children.append(cls(
+                        user_id=task.user_id,
+                        title=task.title,
+                        start_date=start_date,
+                        due_date=due_date,
+                        recurring_mode=task.recurring_mode,
+                        recurring_period=task.recurring_period,
+                        recurring_parent_id=parent_id,
+                    ))
+                count += 1
+                start_date, due_date = task.get_occurrence(count)
+        return cls.objects.bulk_create(children)
+
     def get_absolute_url(self):
         return reverse("orgapy:task", args=[self.id])
         
 
+def count_checklist_items(checklist: str | None) -> tuple[int, int]:
+    """Return the number of items and of checked items of a checklist, in a
+    single pass over its text."""
+    total = completed = 0
+    for match in CHECKLIST_ITEM_PATTERN.finditer(checklist or ""):
+        total += 1
+        completed += match.group(1) == "x"
+    return total, completed
+
+
 class Project(models.Model):
 
     ACTIVE = "AC"
@@ -357,17 +613,36 @@ class Project(models.Model):
     date_archived = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(default=timezone.now)
     title = models.CharField(max_length=255, blank=True, null=True)
+    title_key = models.CharField(max_length=TITLE_KEY_LENGTH, blank=True, default="", editable=False)
     checklist = models.TextField(blank=True, null=True)
+    items_count = models.PositiveIntegerField(default=0)
+    completed_items_count = models.PositiveIntegerField(default=0)
     document = models.ForeignKey("Document", on_delete=models.SET_NULL, null=True, blank=True)
     status = models.CharField(max_length=2, choices=STATUS_CHOICES, default=ACTIVE)
 
     class Meta:
 
         ordering = ["-date_creation"]
+        indexes = [
+            models.Index(fields=["user", "title_key"], name="orgapy_project_title_key"),
+        ]
 
     def __str__(self):
         return f"{ self.user} - { self.id }. { self.title }"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "title" in update_fields:
+            self.title_key = get_title_key(self.title)
+            if update_fields is not None:
+                update_fields = kwargs["update_fields"] = [*update_fields, "title_key"]
+        suggestion_cache.invalidate(self.user_id)
+        if update_fields is None or "checklist" in update_fields:
+            self.items_count, self.completed_items_count = count_checklist_items(self.checklist)
+            if update_fields is not None:
+                kwargs["update_fields"] = [*update_fields, "items_count", "completed_items_count"]
+        return super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse("orgapy:project", args=[self.id])
     
@@ -375,18 +650,6 @@ class Project(models.Model):
     def etag(self) -> str:
         return hashlib.sha256(f"{self.id}:{self.updated_at.timestamp()}".encode()).hexdigest()
 
-    @property
-    def items_count(self) -> int:
-        if self.checklist is None:
-            return 0
-        return len(re.findall(r"^\[[ x]\]", self.checklist, re.MULTILINE))
-
-    @property
-    def completed_items_count(self) -> int:
-        if self.checklist is None:
-            return 0
-        return len(re.findall(r"^\[x\]", self.checklist, re.MULTILINE))
-
     @property
     def all_completed(self) -> bool:
         return self.completed_items_count == self.items_count
@@ -424,6 +687,24 @@ class Project(models.Model):
         p = self.completed_items_count
         return ceil(100 * p / q)
 
+    @staticmethod
+    def get_progress_expression() -> models.Func:
+        """Completed ratio of the checklist, null for empty checklists, to
+        sort projects in SQL."""
+        return Cast("completed_items_count", models.FloatField()) / NullIf("items_count", 0)
+
+
+class GetCtag(BaseElement):
+    tag = "{http://calendarserver.org/ns/}getctag"
+
+
+def _as_datetime(value: datetime.date) -> datetime.datetime:
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
 
 class Calendar(models.Model):
 
@@ -433,9 +714,18 @@ class Calendar(models.Model):
     username = models.CharField(max_length=255)
     password = models.CharField(max_length=255)
     calendar_name = models.CharField(max_length=255)
+    calendar_url = models.CharField(max_length=255, blank=True, null=True)
+    ctag = models.CharField(max_length=255, blank=True, null=True)
+    sync_token = models.CharField(max_length=255, blank=True, null=True)
+    synced_until = models.DateTimeField(blank=True, null=True)
     last_sync = models.DateTimeField(blank=True, null=True)
+    last_sync_attempt = models.DateTimeField(blank=True, null=True)
+    sync_failures = models.PositiveIntegerField(default=0)
     sync_period = models.PositiveIntegerField(default=86400)
-    events = models.TextField(blank=True, null=True)
+
+    # Written by background syncs, which must not overwrite concurrent edits
+    # of the other fields
+    SYNC_STATE_FIELDS = ["calendar_url", "ctag", "sync_token", "synced_until", "last_sync", "last_sync_attempt"]
 
     class Meta:
 
@@ -444,43 +734,145 @@ class Calendar(models.Model):
     def __str__(self):
         return f"{ self.user } - { self.id }. { self.calendar_name }"
 
-    def fetch_events(self):
-        self.last_sync = timezone.now()
+    def reset_sync_state(self):
+        """Forget the resolved calendar and its sync state, forcing the next
+        sync to rediscover the calendar and download all events."""
+        self.calendar_url = None
+        self.ctag = None
+        self.sync_token = None
+        self.synced_until = None
+
+    def _get_remote_calendar(self, client: caldav.DAVClient) -> caldav.Calendar | None:
+        if self.calendar_url:
+            return client.calendar(url=self.calendar_url)
+        for calendar in client.principal().calendars():
+            if calendar.name == self.calendar_name:
+                self.calendar_url = str(calendar.url)
+                return calendar
+        return None
+
+    def _build_event(self, url, component) -> "CalendarEvent":
+        dtstart = component["DTSTART"].dt
+        dtend = component["DTEND"].dt if "DTEND" in component else dtstart
+        location = component.get("LOCATION")
+        return CalendarEvent(
+            calendar=self,
+            url=str(url),
+            uid=str(component.get("UID", "")),
+            title=str(component["SUMMARY"]),
+            location=None if location is None else str(location),
+            dtstart=_as_datetime(dtstart),
+            dtend=_as_datetime(dtend),
+            all_day=not isinstance(dtstart, datetime.datetime))
+
+    def _search_events(self, calendar: caldav.Calendar, start: datetime.datetime, end: datetime.datetime) -> list["CalendarEvent"]:
         events = []
-        lookahead = self.user.settings.calendar_lookahead
-        now = datetime.datetime.now()
-        this_morning = datetime.datetime(now.year, now.month, now.day, 0, 0, 0, 0, now.tzinfo)
-        with caldav.DAVClient(url=self.url, username=self.username, password=self.password) as client:
-            principal = client.principal()
-            for calendar in principal.calendars():
-                if calendar.name != self.calendar_name:
-                    continue
-                events = calendar.search(
-                    start=this_morning,
-                    end=this_morning + datetime.timedelta(days=lookahead),
-                    event=True,
-                    expand=True)
-        events_data = []
-        for event in events:
+        for event in calendar.search(start=start, end=end, event=True, expand=True):
             for subcomponent in event.icalendar_instance.subcomponents:
                 if "SUMMARY" not in subcomponent:
                     continue
-                location = subcomponent.get("LOCATION")
-                events_data.append({
-                    "url": event.url,
-                    "title": str(subcomponent["SUMMARY"]),
-                    "dtstart": subcomponent["DTSTART"].dt.isoformat(),
-                    "dtend": subcomponent["DTEND"].dt.isoformat(),
-                    "location": None if location is None else str(location)
-                })
-        self.events = json.dumps(events_data, default=str)
-        self.save()
+                events.append(self._build_event(event.url, subcomponent))
+        return events
+
+    def _fetch_changes(self, calendar: caldav.Calendar, start: datetime.datetime, end: datetime.datetime) -> tuple[set[str], list["CalendarEvent"]] | None:
+        """Fetch the objects changed since the stored sync token, and return
+        their URLs along with their occurrences in the [start, end) window.
+        Return None if the server can not tell what changed."""
+        if not self.sync_token:
+            return None
+        try:
+            changes = calendar.get_objects_by_sync_token(sync_token=self.sync_token, load_objects=True, disable_fallback=True)
+        except (DAVError, NotFoundError):
+            return None
+        events = []
+        for obj in changes:
+            if not obj.data:
+                continue
+            for occurrence in recurring_ical_events.of(obj.icalendar_instance).between(start, end):
+                if "SUMMARY" in occurrence:
+                    events.append(self._build_event(obj.url, occurrence))
+        self.sync_token = changes.sync_token
+        return set(str(obj.url) for obj in changes), events
+
+    def fetch_events(self, timeout: int | None = None):
+        """Download the events of the lookahead window. If the collection
+        ctag did not change since the last sync, only the days that entered
+        the window are downloaded. Otherwise, changes are fetched with the
+        sync token when the server supports it, and the whole window is
+        downloaded again if not."""
+        self.last_sync = timezone.now()
+        lookahead = self.user.settings.calendar_lookahead
+        now = timezone.localtime()
+        this_morning = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        window_end = this_morning + datetime.timedelta(days=lookahead)
+        stale_urls: set[str] | None = None
+        new_events: list[CalendarEvent] | None = None
+        with client_pool.client(self.url, self.username, self.password, timeout=timeout) as client:
+            cached = bool(self.calendar_url)
+            calendar = self._get_remote_calendar(client)
+            if calendar is None:
+                new_events = []
+                self.reset_sync_state()
+            else:
+                try:
+                    props = calendar.get_properties([GetCtag(), dav.SyncToken()])
+                except NotFoundError:
+                    if not cached:
+                        raise
+                    self.reset_sync_state()
+                    return self.fetch_events(timeout=timeout)
+                ctag = props.get(GetCtag.tag)
+                if ctag is not None and self.synced_until is not None and self.synced_until > this_morning:
+                    stale_urls, new_events = set(), []
+                    if ctag != self.ctag:
+                        changes = self._fetch_changes(calendar, this_morning, self.synced_until)
+                        if changes is None:
+                            new_events = None
+                        else:
+                            stale_urls, new_events = changes
+                    if new_events is not None and window_end > self.synced_until:
+                        new_events += [
+                            event for event in self._search_events(calendar, self.synced_until, window_end)
+                            if event.dtstart >= self.synced_until]
+                if new_events is None:
+                    stale_urls = None
+                    new_events = self._search_events(calendar, this_morning, window_end)
+                    self.sync_token = props.get(dav.SyncToken.tag)
+                    self.synced_until = window_end
+                self.ctag = ctag
+                self.synced_until = max(window_end, self.synced_until)
+        with transaction.atomic():
+            events = CalendarEvent.objects.filter(calendar=self)
+            if stale_urls is None:
+                events.delete()
+            else:
+                events.filter(models.Q(dtend__lte=this_morning) | models.Q(url__in=stale_urls)).delete()
+            CalendarEvent.objects.bulk_create(new_events)
+            self.save(update_fields=self.SYNC_STATE_FIELDS)
+
+
+class CalendarEvent(models.Model):
+
+    id = models.BigAutoField(primary_key=True)
+    calendar = models.ForeignKey(Calendar, on_delete=models.CASCADE)
+    url = models.CharField(max_length=512)
+    uid = models.TextField(blank=True)
+    title = models.TextField()
+    location = models.TextField(blank=True, null=True)
+    dtstart = models.DateTimeField()
+    dtend = models.DateTimeField()
+    all_day = models.BooleanField(default=False)
+
+    class Meta:
 
-    def get_events(self, force: bool = False) -> list[dict]:
-        now = timezone.now()
-        if force or self.last_sync is None or (now - self.last_sync).total_seconds() > self.sync_period:
-            self.fetch_events()
-        return json.loads(self.events) if self.events else []
+        ordering = ["dtstart", "title"]
+        indexes = [
+            models.Index(fields=["calendar", "dtstart"], name="orgapy_event_calendar_start"),
+            models.Index(fields=["calendar", "url"], name="orgapy_event_calendar_url"),
+        ]
+
+    def __str__(self):
+        return f"{ self.calendar_id } - { self.dtstart }. { self.title }"
 
 
 class ProgressLog(models.Model):
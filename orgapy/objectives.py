@@ -0,0 +1,233 @@
+import datetime
+from typing import Iterable
+
+from django.core.cache import cache
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import Objective, ObjectiveCompletion
+
+
+OBJECTIVE_CACHE_TIMEOUT = 86400
+
+SLOT_STATE_COMPLETE = 0
+SLOT_STATE_MISSED = 1
+SLOT_STATE_BUTTON = 2
+SLOT_STATE_COOLDOWN = 3
+SLOT_STATE_FUTURE = 4
+SLOT_STATE_FUTURE_COMPLETE = 5
+
+
+class Slot:
+
+    def __init__(self, start: datetime.date, length: int, state: int, early: bool = False, late: bool = False):
+        self.start = start
+        self.length = length
+        self.state = state
+        self.early = early
+        self.late = late
+
+    @property
+    def end(self) -> datetime.date:
+        return self.start + datetime.timedelta(days=self.length)
+
+
+def get_day(dt: datetime.datetime, start_hours: int) -> datetime.date:
+    """Objective days begin at `start_hours`: earlier times belong to the
+    previous day."""
+    dt = timezone.localtime(dt)
+    if dt.hour < start_hours:
+        dt -= datetime.timedelta(days=1)
+    return dt.date()
+
+
+def get_day_start(day: datetime.date, start_hours: int) -> int:
+    return int(timezone.make_aware(datetime.datetime.combine(day, datetime.time(start_hours))).timestamp())
+
+
+def get_year_start(now: datetime.datetime) -> datetime.datetime:
+    return timezone.localtime(now).replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def get_history_start(now: datetime.datetime) -> int:
+    """Completions older than this timestamp are not needed to evaluate the
+    slots of the current year, since a period lasts at most 365 days."""
+    return int((get_year_start(now) - datetime.timedelta(days=365)).timestamp())
+
+
+def get_slots(days: list[datetime.date], period: int, flexible: bool, today: datetime.date, until: datetime.date, origin: datetime.date | None = None) -> list[Slot]:
+    """Split time into periods starting from the first completion, and tell
+    whether each one was completed. Flexible objectives restart their period
+    from the last completion instead of following a fixed schedule. Fixed
+    periods are aligned with `origin`, the day of the first completion ever,
+    when `days` is only a window of the history. This mirrors the rules that
+    were previously applied in `objectives.js`."""
+    if not days:
+        return [Slot(today, 1, SLOT_STATE_BUTTON)]
+    n, i, early, late, preset = len(days), 0, False, False, False
+    slots: list[Slot] = []
+    date_start = days[0]
+    if not flexible and origin is not None:
+        date_start -= datetime.timedelta(days=(date_start - origin).days % period)
+    while date_start < until:
+        preset_used = False
+        while i < n and days[i] < date_start:
+            i += 1
+        date_end = date_start + datetime.timedelta(days=period)
+        cut = False
+        if flexible:
+            if early:
+                date_end = date_start + datetime.timedelta(days=1)
+                preset = True
+            elif late:
+                date_end = date_start + datetime.timedelta(days=1)
+            elif preset:
+                length = period - slots[-2].length - 1
+                if length > 0:
+                    preset_used = True
+                    date_end = date_start + datetime.timedelta(days=length)
+            else:
+                for j in range(i, n):
+                    if date_start < days[j] < date_end:
+                        date_end = days[j]
+                        break
+                    if days[j] >= date_end:
+                        break
+                if date_start < today < date_end:
+                    cut = True
+                    date_end = today
+        completed = i < n and days[i] < date_end
+        state = SLOT_STATE_MISSED
+        if preset_used:
+            state = SLOT_STATE_FUTURE_COMPLETE
+        elif completed:
+            state = SLOT_STATE_COMPLETE
+        elif date_start <= today < date_end:
+            state = SLOT_STATE_BUTTON
+        elif today < date_start:
+            state = SLOT_STATE_FUTURE
+        if flexible and state == SLOT_STATE_BUTTON:
+            date_end = date_start + datetime.timedelta(days=1)
+        slots.append(Slot(date_start, (date_end - date_start).days, state, early, late))
+        date_start = date_end
+        if not early:
+            preset = False
+        if cut:
+            early = completed
+            late = not completed
+        else:
+            early = False
+            late = False
+    return slots
+
+
+def evaluate(timestamps: list[int], origin: int | None, period: int, flexible: bool, start_hours: int, now: datetime.datetime, partial: bool = False) -> dict:
+    """Compute the slots of the current year, the state of the current
+    slot, the number of consecutive completed slots up to now and the end of
+    the first slot that still needs a completion. If `partial` is set,
+    `timestamps` only hold the end of the history, and a streak running
+    back to the first of them is unknown and returned as None."""
+    today = get_day(now, start_hours)
+    year_start = get_year_start(now).date()
+    until = year_start.replace(year=year_start.year + 1) - datetime.timedelta(days=1)
+    utc = datetime.timezone.utc
+    days = [get_day(datetime.datetime.fromtimestamp(ts, utc), start_hours) for ts in sorted(timestamps)]
+    origin_day = None if origin is None else get_day(datetime.datetime.fromtimestamp(origin, utc), start_hours)
+    slots = get_slots(days, period, flexible, today, until, origin_day)
+    status = None
+    streak = 0
+    streak_open = True
+    due = None
+    for slot in reversed(slots):
+        if slot.start > today:
+            continue
+        if slot.end > today:
+            status = slot.state
+            if slot.state == SLOT_STATE_BUTTON:
+                continue
+        if streak_open and slot.state in (SLOT_STATE_COMPLETE, SLOT_STATE_FUTURE_COMPLETE):
+            streak += 1
+        else:
+            streak_open = False
+    if partial and streak_open:
+        streak = None
+    for slot in slots:
+        if slot.end > today and slot.state not in (SLOT_STATE_COMPLETE, SLOT_STATE_FUTURE_COMPLETE):
+            due = get_day_start(slot.end, start_hours)
+            break
+    year_start_ts = int(get_year_start(now).timestamp())
+    return {
+        "status": status,
+        "streak": streak,
+        "due": due,
+        "slots": [
+            [get_day_start(slot.start, start_hours), slot.length, slot.state, slot.early, slot.late]
+            for slot in slots
+            if slot.end > year_start
+        ],
+        "history": [ts for ts in timestamps if ts >= year_start_ts],
+    }
+
+
+def _cache_key(objective_id: int) -> str:
+    return f"orgapy:objective:{objective_id}"
+
+
+def _get_timestamps(objective_ids: list[int], since: int | None = None) -> dict[int, list[int]]:
+    timestamps: dict[int, list[int]] = {objective_id: [] for objective_id in objective_ids}
+    qs = ObjectiveCompletion.objects.filter(objective_id__in=objective_ids)
+    if since is not None:
+        qs = qs.filter(ts__gte=since)
+    for objective_id, ts in qs.order_by("ts").values_list("objective_id", "ts"):
+        timestamps[objective_id].append(ts)
+    return timestamps
+
+
+def evaluate_objectives(objectives: Iterable[Objective], start_hours: int, now: datetime.datetime | None = None) -> list[dict]:
+    """Serialize objectives along with their evaluation. Evaluations are
+    cached per objective for the current day; on cache misses, the needed
+    completions are fetched with two queries overall, plus one for the
+    objectives whose streak outlasts the fetched history."""
+    if now is None:
+        now = timezone.now()
+    objectives = list(objectives)
+    version = [get_day(now, start_hours).isoformat(), start_hours]
+    cached = cache.get_many([_cache_key(objective.id) for objective in objectives])
+    evaluations = {}
+    for objective in objectives:
+        entry = cached.get(_cache_key(objective.id))
+        if entry is not None and entry["version"] == version:
+            evaluations[objective.id] = entry["evaluation"]
+    missing = [objective.id for objective in objectives if objective.id not in evaluations]
+    if missing:
+        history_start = get_history_start(now)
+        timestamps = _get_timestamps(missing, history_start)
+        origins = dict(ObjectiveCompletion.objects\
+            .filter(objective_id__in=missing)\
+            .values("objective_id")\
+            .annotate(origin=Min("ts"))\
+            .values_list("objective_id", "origin"))
+        to_cache = {}
+        unknown_streaks = []
+        for objective in objectives:
+            if objective.id not in timestamps:
+                continue
+            origin = origins.get(objective.id)
+            partial = origin is not None and origin < history_start
+            evaluation = evaluate(timestamps[objective.id], origin, objective.period, objective.flexible, start_hours, now, partial)
+            if evaluation["streak"] is None:
+                unknown_streaks.append(objective)
+            evaluations[objective.id] = evaluation
+        if unknown_streaks:
+            timestamps = _get_timestamps([objective.id for objective in unknown_streaks])
+            for objective in unknown_streaks:
+                evaluation = evaluate(timestamps[objective.id], origins[objective.id], objective.period, objective.flexible, start_hours, now)
+                evaluations[objective.id]["streak"] = evaluation["streak"]
+        for objective_id in missing:
+            to_cache[_cache_key(objective_id)] = {"version": version, "evaluation": evaluations[objective_id]}
+        cache.set_many(to_cache, OBJECTIVE_CACHE_TIMEOUT)
+    return [{**objective.to_dict(), **evaluations[objective.id]} for objective in objectives]
+
+
+def invalidate_objective(objective_id: int):
+    cache.delete(_cache_key(objective_id))
@@ -0,0 +1,139 @@
+import datetime
+import hashlib
+from collections.abc import Sequence
+from functools import cached_property
+from typing import Any
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import BadRequest
+from django.db.models import Q, QuerySet
+
+
+CURSOR_SALT = "orgapy.pagination.cursor"
+COUNT_CACHE_TIMEOUT = 60
+
+
+def _encode_value(value: Any) -> list:
+    if isinstance(value, datetime.datetime):
+        return ["dt", value.isoformat()]
+    if isinstance(value, datetime.date):
+        return ["d", value.isoformat()]
+    return ["v", value]
+
+
+def _decode_value(item: list) -> Any:
+    kind, value = item
+    if kind == "dt":
+        return datetime.datetime.fromisoformat(value)
+    if kind == "d":
+        return datetime.date.fromisoformat(value)
+    return value
+
+
+def _keyset_filter(ordering: list[str], values: list[Any], backwards: bool) -> Q:
+    """Build the condition selecting rows strictly after (or before) a key
+    in the given lexicographic ordering."""
+    condition = Q()
+    prefix = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        descending = field.startswith("-") != backwards
+        condition |= prefix & Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+        prefix &= Q(**{name: value})
+    return condition
+
+
+def _reverse_ordering(ordering: list[str]) -> list[str]:
+    return [field[1:] if field.startswith("-") else "-" + field for field in ordering]
+
+
+class CursorPaginator:
+    """
+    Keyset paginator with the `count` and `get_page` of Django's `Paginator`.
+
+    Pages are addressed by opaque signed cursors encoding the sort key of the
+    first or last row of the neighbouring page, so fetching any page costs a
+    single indexed range scan instead of an `OFFSET`, and pages have no
+    number. The total count is cached for a short period and should be
+    treated as approximate.
+
+    Args:
+        queryset: Rows to paginate.
+        ordering: Fields defining a total order over the rows.
+            The last field must be unique (typically `id` or `-id`).
+            Fields must not be nullable: use an annotation with `Coalesce`.
+        per_page: Number of rows per page.
+    """
+
+    def __init__(self, queryset: QuerySet, ordering: list[str], per_page: int):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+
+    @cached_property
+    def count(self) -> int:
+        sql = str(self.queryset.order_by().query)
+        key = "orgapy:count:" + hashlib.sha256(sql.encode()).hexdigest()
+        return cache.get_or_set(key, self.queryset.count, COUNT_CACHE_TIMEOUT) # type: ignore
+
+    def _make_cursor(self, obj: Any, backwards: bool) -> str:
+        values = [_encode_value(getattr(obj, field.lstrip("-"))) for field in self.ordering]
+        return signing.dumps({"v": values, "b": backwards}, salt=CURSOR_SALT, compress=True)
+
+    def get_page(self, cursor: str | None) -> "CursorPage":
+        backwards = False
+        qs = self.queryset.order_by(*self.ordering)
+        if cursor:
+            try:
+                data = signing.loads(cursor, salt=CURSOR_SALT)
+                values = [_decode_value(item) for item in data["v"]]
+                backwards = bool(data["b"])
+            except (signing.BadSignature, KeyError, TypeError, ValueError):
+                raise BadRequest("Invalid cursor")
+            if len(values) != len(self.ordering):
+                raise BadRequest("Invalid cursor")
+            qs = qs.filter(_keyset_filter(self.ordering, values, backwards))
+            if backwards:
+                qs = qs.order_by(*_reverse_ordering(self.ordering))
+        rows = list(qs[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = bool(cursor), has_more
+        return CursorPage(
+            rows,
+            self,
+            next_cursor=self._make_cursor(rows[-1], False) if rows and has_next else None,
+            previous_cursor=self._make_cursor(rows[0], True) if rows and has_previous else None,
+        )
+
+
+class CursorPage(Sequence):
+
+    def __init__(self, object_list: list, paginator: CursorPaginator, next_cursor: str | None, previous_cursor: str | None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self.object_list)} objects>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
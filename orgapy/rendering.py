@@ -0,0 +1,183 @@
+import re
+import xml.etree.ElementTree as etree
+
+from django.core.cache import cache
+
+from .models import Document
+
+try:
+    import markdown
+    from markdown.blockprocessors import BlockProcessor
+    from markdown.extensions import Extension
+    from markdown.inlinepatterns import SimpleTagInlineProcessor
+    from markdown.treeprocessors import Treeprocessor
+except ImportError:
+    markdown = None
+
+
+RENDER_CACHE_TIMEOUT = 7 * 86400
+
+MATH_PATTERN = re.compile(r"\$\$|~[^~\n]+~")
+DETAILS_START_PATTERN = re.compile(r":::details[ \t]+([^\n]+)\n?")
+DETAILS_END_PATTERN = re.compile(r"^:::[ \t]*$", re.MULTILINE)
+MARK_PATTERN = r"(==)([^=\n]+)=="
+NBSP_BEFORE_PATTERN = re.compile(r"(\w) ([:?!;»€°])", re.ASCII)
+NBSP_AFTER_PATTERN = re.compile(r"([«°]) (\w)", re.ASCII)
+EMBED_PATTERN = re.compile(r"@embed(note|sheet|map)/([a-zA-Z0-9]+)")
+REFERENCE_PATTERN = re.compile(r"@(note|sheet|map)/([a-zA-Z0-9]+)")
+SLUG_PATTERN = re.compile(r"[^\w]")
+HEADER_PATTERN = re.compile(r"<(/?)h([1-6])")
+CODE_PATTERN = re.compile(r'<pre><code class="language-([^"]+)">')
+TASK_PATTERN = re.compile(r"<li>(<p>)?\[( |x)\] ?")
+
+TYPE_ICONS = {
+    "note": "ri-sticky-note-line",
+    "sheet": "ri-table-line",
+    "map": "ri-map-2-line",
+}
+
+WIDGETS = [
+    ("widget-status", re.compile(r"(✅|❌|⏺️)")),
+    ("widget-color-round", re.compile(r"(🔴|🟠|🟡|🟢|🔵|🟣|🟤|⚫|⚪)")),
+    ("widget-color-square", re.compile(r"(🟥|🟧|🟨|🟩|🟦|🟪|🟫|⬛|⬜)")),
+]
+
+
+def is_prerenderable(content: str) -> bool:
+    """Math is typeset by a Showdown extension in the browser, hence notes
+    containing math delimiters are left for client-side rendering."""
+    return markdown is not None and MATH_PATTERN.search(content) is None
+
+
+def _render_embed(match: re.Match) -> str:
+    doctype, nonce = match.groups()
+    actions = f'<div class="iframe-actions"><a class="button" href="{nonce}"><i class="ri-arrow-right-circle-line"></i> View {doctype}</a></div>'
+    if doctype == "note":
+        return f'<div class="iframe-container embed-note" embed-nonce="{nonce}"><div class="card-note"></div>{actions}</div>'
+    return f'<div class="iframe-container"><iframe src="{nonce}?embed=1"></iframe>{actions}</div>'
+
+
+def _render_reference(match: re.Match) -> str:
+    doctype, nonce = match.groups()
+    return f'<a class="reference label" ref-type="{doctype}" ref-nonce="{nonce}"><i class="{TYPE_ICONS[doctype]}" title="{doctype.capitalize()}"></i> <span>{match.group(0)}</span></a>'
+
+
+def _add_nbsp(text: str | None) -> str | None:
+    if not text:
+        return text
+    text = NBSP_BEFORE_PATTERN.sub("\\1\u00a0\\2", text)
+    return NBSP_AFTER_PATTERN.sub("\\1\u00a0\\2", text)
+
+
+if markdown is not None:
+
+    class DetailsProcessor(BlockProcessor):
+        """Turn blocks between `:::details <summary>` and `:::` into a
+        `<details>` element. Code blocks are stashed before block processors
+        run, so they are left alone."""
+
+        def test(self, parent, block):
+            return DETAILS_START_PATTERN.match(block) is not None
+
+        def run(self, parent, blocks):
+            start = DETAILS_START_PATTERN.match(blocks[0])
+            assert start is not None
+            remaining = [blocks[0][start.end():]] + blocks[1:]
+            for i, block in enumerate(remaining):
+                end = DETAILS_END_PATTERN.search(block)
+                if end is not None:
+                    break
+            else:
+                return False
+            content = remaining[:i] + [block[:end.start()].rstrip("\n")]
+            rest = block[end.end():].lstrip("\n")
+            del blocks[:i + 1]
+            if rest:
+                blocks.insert(0, rest)
+            details = etree.SubElement(parent, "details")
+            summary = etree.SubElement(details, "summary")
+            summary.text = start.group(1).strip()
+            self.parser.parseChunk(details, "\n\n".join(content))
+
+    class TypographyProcessor(Treeprocessor):
+        """Insert non-breaking spaces around French punctuation in
+        paragraphs, as `markdownToHtmlFancy` does once rendered, except in
+        inline code."""
+
+        def run(self, root):
+            for paragraph in root.iter("p"):
+                paragraph.text = _add_nbsp(paragraph.text)
+                for element in paragraph.iter():
+                    if element is paragraph:
+                        continue
+                    if element.tag != "code":
+                        element.text = _add_nbsp(element.text)
+                    element.tail = _add_nbsp(element.tail)
+
+    class OrgapyExtension(Extension):
+        """Syntax extensions of the Showdown converter of `orgapy.js`."""
+
+        def extendMarkdown(self, md):
+            md.parser.blockprocessors.register(DetailsProcessor(md.parser), "details", 95)
+            md.inlinePatterns.register(SimpleTagInlineProcessor(MARK_PATTERN, "mark"), "mark", 65)
+            md.treeprocessors.register(TypographyProcessor(md), "typography", 15)
+
+
+def render_markdown(content: str) -> str:
+    """Convert a note to HTML, mimicking the Showdown configuration and
+    extensions of `markdownToHtmlFancy` in `orgapy.js`."""
+    assert markdown is not None
+    html = markdown.markdown(
+        content,
+        extensions=["fenced_code", "tables", "sane_lists", "nl2br", "md_in_html", "toc", OrgapyExtension()],
+        extension_configs={"toc": {"slugify": lambda value, separator: SLUG_PATTERN.sub("", value).lower()}})
+    html = HEADER_PATTERN.sub(lambda m: f"<{m.group(1)}h{min(6, int(m.group(2)) + 1)}", html)
+    html = html.replace("<table>", '<div class="table-wrapper"><table class="table">').replace("</table>", "</table></div>")
+    html = CODE_PATTERN.sub(r'<pre class="code" data-lang="\1"><code class="language-\1">', html)
+    html = TASK_PATTERN.sub(lambda m: f'<li>{m.group(1) or ""}<input type="checkbox" class="widget widget-checkbox"{" checked" if m.group(2) == "x" else ""}>', html)
+    for classname, pattern in WIDGETS:
+        html = pattern.sub(rf'<span class="widget {classname}">\1</span>', html)
+    html = EMBED_PATTERN.sub(_render_embed, html)
+    html = REFERENCE_PATTERN.sub(_render_reference, html)
+    return html
+
+
+def _cache_key(etag: str) -> str:
+    return f"orgapy:note-html:{etag}"
+
+
+def render_note(doc: Document) -> str | None:
+    """Return the HTML of a note, cached by its etag, or None if the note
+    must be rendered client-side."""
+    if doc.type != Document.NOTE or not is_prerenderable(doc.content or ""):
+        return None
+    key = _cache_key(doc.etag)
+    html = cache.get(key)
+    if html is None:
+        html = render_markdown(doc.content or "")
+        cache.set(key, html, RENDER_CACHE_TIMEOUT)
+    return html
+
+
+def get_embedded_notes(doc: Document, owner_view: bool) -> dict[str, dict]:
+    """Fetch the notes embedded in a document with a single query, so that
+    they can be inlined in the page instead of loaded through iframes.
+
+    Each entry holds either the pre-rendered HTML of the note or, if it must
+    be rendered client-side, its raw content.
+    """
+    nonces = set(nonce for doctype, nonce in EMBED_PATTERN.findall(doc.content or "") if doctype == "note")
+    if not nonces:
+        return {}
+    qs = Document.objects.filter(user_id=doc.user_id, type=Document.NOTE, deleted=False, nonce__in=nonces) # type: ignore
+    if not owner_view:
+        qs = qs.filter(public=True)
+    embeds = {}
+    for embedded in qs.only("id", "nonce", "type", "title", "content", "updated_at"):
+        html = render_note(embedded)
+        embeds[embedded.nonce] = {
+            "title": embedded.title,
+            "html": html,
+            "content": None if html is not None else embedded.content,
+        }
+    return embeds
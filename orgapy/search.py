@@ -0,0 +1,267 @@
+import abc
+import difflib
+import re
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import F, Q, QuerySet, Value
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import SafeString, mark_safe
+
+from .models import Document
+
+
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+SNIPPET_ELLIPSIS = "…"
+SNIPPET_TOKENS = 16
+
+FUZZY_MIN_RESULTS = 3
+FUZZY_MAX_CANDIDATES = 100
+FUZZY_MIN_SIMILARITY = 0.7
+
+
+def parse_query(user_input: str) -> tuple[list[str], list[str]]:
+    """Split user input into quoted phrases and remaining words."""
+    phrases = re.findall(r'"([^"]+)"', user_input)
+    remaining = re.sub(r'"[^"]+"', '', user_input)
+    words = re.findall(r'\w+', remaining)
+    return phrases, words
+
+
+def build_fts_query(user_input: str) -> str:
+    """Turn user input into an FTS5 query: quoted phrases are kept as is,
+    other words are matched as prefixes."""
+    phrases, words = parse_query(user_input)
+    parts = []
+    parts.extend(f'"{p}"' for p in phrases)
+    parts.extend(f'{w}*' for w in words)
+    return ' '.join(parts)
+
+
+def build_tsquery(user_input: str) -> str:
+    """Same as `build_fts_query`, in PostgreSQL `to_tsquery` syntax."""
+    phrases, words = parse_query(user_input)
+    parts = []
+    for phrase in phrases:
+        tokens = re.findall(r'\w+', phrase)
+        if tokens:
+            parts.append("(" + " <-> ".join(tokens) + ")")
+    parts.extend(f'{w}:*' for w in words)
+    return ' & '.join(parts)
+
+
+def get_trigrams(word: str) -> list[str]:
+    word = word.lower()
+    return [word[i:i + 3] for i in range(len(word) - 2)]
+
+
+def build_trigram_query(user_input: str) -> str:
+    """Turn user input into an FTS5 query matching any trigram of its words,
+    for the `trigram` tokenizer."""
+    phrases, words = parse_query(user_input)
+    trigrams: list[str] = []
+    for word in words + [w for phrase in phrases for w in re.findall(r'\w+', phrase)]:
+        trigrams.extend(t for t in get_trigrams(word) if t not in trigrams)
+    return ' OR '.join(f'"{t}"' for t in trigrams)
+
+
+def get_title_similarity(query_words: list[str], title: str) -> float:
+    """Average, over query words, of the similarity with the closest word of
+    the title, between 0 and 1."""
+    title_words = [w.lower() for w in re.findall(r'\w+', title)]
+    if not query_words or not title_words:
+        return 0
+    total = 0.0
+    for word in query_words:
+        total += max(difflib.SequenceMatcher(None, word.lower(), w).ratio() for w in title_words)
+    return total / len(query_words)
+
+
+class SearchBackend(abc.ABC):
+    """Full-text search over documents.
+
+    `search` restricts a queryset to the documents matching a query, and
+    annotates them with a `relevance` (lower is better) and a `snippet` of
+    their content where matched terms are enclosed between `SNIPPET_START`
+    and `SNIPPET_END`, or an empty string if the backend has no snippets.
+    Both are SQL expressions, so that sorting and pagination happen in the
+    database.
+    """
+
+    name: str
+    supports_fuzzy = False
+
+    @abc.abstractmethod
+    def search(self, qs: QuerySet[Document], query: str, title_weight: float, content_weight: float) -> QuerySet[Document]:
+        raise NotImplementedError()
+
+    def fuzzy_candidates(self, qs: QuerySet[Document], query: str) -> QuerySet[Document]:
+        """Documents whose title may approximately match the query, most
+        likely first. Only called if `supports_fuzzy` is set."""
+        return qs.none()
+
+
+class SqliteSearchBackend(SearchBackend):
+    """FTS5 index maintained by triggers, see migrations 0017 to 0022. The
+    index is joined to documents through the unmanaged `DocumentIndex`."""
+
+    name = "sqlite"
+    supports_fuzzy = True
+
+    def search(self, qs, query, title_weight, content_weight):
+        fts_query = build_fts_query(query)
+        if not fts_query:
+            return qs.none()
+        return qs\
+            .filter(index__fts__match=fts_query, index__rank__match=f"bm25({float(title_weight)}, {float(content_weight)})")\
+            .annotate(
+                relevance=F("index__rank"),
+                snippet=RawSQL(
+                    "snippet(orgapy_document_fts, 1, %s, %s, %s, %s)",
+                    [SNIPPET_START, SNIPPET_END, SNIPPET_ELLIPSIS, SNIPPET_TOKENS],
+                    output_field=models.TextField()))
+
+    def fuzzy_candidates(self, qs, query):
+        trigram_query = build_trigram_query(query)
+        if not trigram_query:
+            return qs.none()
+        return qs.filter(title_index__fts__match=trigram_query).order_by("title_index__rank")
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Generated `tsvector` column with a GIN index, see migration 0031.
+    Titles have weight A and contents weight B."""
+
+    name = "postgresql"
+    supports_fuzzy = True
+
+    def search(self, qs, query, title_weight, content_weight):
+        tsquery = build_tsquery(query)
+        if not tsquery:
+            return qs.none()
+        top = max(title_weight, content_weight)
+        weights = [0, 0, content_weight / top, title_weight / top]
+        headline_options = f"StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords={SNIPPET_TOKENS}, MinWords={SNIPPET_TOKENS // 2}"
+        return qs\
+            .filter(id__in=RawSQL("SELECT id FROM orgapy_document WHERE search_vector @@ to_tsquery('simple', %s)", [tsquery]))\
+            .annotate(
+                relevance=RawSQL(
+                    "-ts_rank(%s::float4[], orgapy_document.search_vector, to_tsquery('simple', %s))",
+                    [weights, tsquery],
+                    output_field=models.FloatField()),
+                snippet=RawSQL(
+                    "ts_headline('simple', COALESCE(orgapy_document.content, ''), to_tsquery('simple', %s), %s)",
+                    [tsquery, headline_options],
+                    output_field=models.TextField()))
+
+    def fuzzy_candidates(self, qs, query):
+        phrases, words = parse_query(query)
+        text = " ".join(phrases + words)
+        if not text:
+            return qs.none()
+        return qs\
+            .filter(id__in=RawSQL("SELECT id FROM orgapy_document WHERE %s <%% title", [text]))\
+            .order_by(RawSQL("word_similarity(%s, orgapy_document.title)", [text]).desc())
+
+
+class ContainsSearchBackend(SearchBackend):
+    """Case-insensitive substring matching, for databases without a
+    full-text index. Every term must appear in the title or the content,
+    and relevance sums the weights of the fields each term appears in."""
+
+    name = "icontains"
+
+    def search(self, qs, query, title_weight, content_weight):
+        phrases, words = parse_query(query)
+        terms = phrases + words
+        if not terms:
+            return qs.none()
+        relevance = Value(0.0)
+        for term in terms:
+            qs = qs.filter(Q(title__icontains=term) | Q(content__icontains=term))
+            relevance = relevance\
+                - models.Case(models.When(title__icontains=term, then=Value(float(title_weight))), default=Value(0.0))\
+                - models.Case(models.When(content__icontains=term, then=Value(float(content_weight))), default=Value(0.0))
+        return qs.annotate(
+            relevance=models.ExpressionWrapper(relevance, output_field=models.FloatField()),
+            snippet=Value("", output_field=models.TextField()))
+
+
+SEARCH_BACKENDS: dict[str, type[SearchBackend]] = {
+    backend.name: backend
+    for backend in [SqliteSearchBackend, PostgresSearchBackend, ContainsSearchBackend]
+}
+
+
+def get_search_backend() -> SearchBackend:
+    """Use the `ORGAPY_SEARCH_BACKEND` setting if defined, or the native
+    full-text search of the database otherwise."""
+    name = getattr(settings, "ORGAPY_SEARCH_BACKEND", None)
+    if name is None:
+        name = connection.vendor if connection.vendor in SEARCH_BACKENDS else ContainsSearchBackend.name
+    return SEARCH_BACKENDS[name]()
+
+
+def find_similar_titles(qs: QuerySet[Document], query: str, backend: SearchBackend) -> list[int]:
+    """Identifiers of the documents whose title approximately matches the
+    query, most similar first. Candidates come from the trigram index of the
+    backend and are scored in Python."""
+    phrases, words = parse_query(query)
+    query_words = words + [w for phrase in phrases for w in re.findall(r'\w+', phrase)]
+    candidates = backend.fuzzy_candidates(qs, query).values_list("id", "title")[:FUZZY_MAX_CANDIDATES]
+    scores = []
+    for document_id, title in candidates:
+        similarity = get_title_similarity(query_words, title or "")
+        if similarity >= FUZZY_MIN_SIMILARITY:
+            scores.append((-similarity, document_id))
+    return [document_id for _, document_id in sorted(scores)]
+
+
+def search_documents(
+        qs: QuerySet[Document],
+        query: str,
+        title_weight: float = 10,
+        content_weight: float = 1,
+        backend: SearchBackend | None = None,
+        fuzzy: bool = True,
+    ) -> QuerySet[Document]:
+    """Restrict documents to those matching a full-text query, annotated
+    with their `relevance` and a content `snippet`.
+
+    If `fuzzy` is set, the backend supports it, and fewer than
+    `FUZZY_MIN_RESULTS` documents match, documents with a similar title are
+    appended to the matches, so that a typo does not leave the results
+    empty. When enough documents match, this costs a single query that
+    stops at the first matches without ranking them.
+    """
+    if backend is None:
+        backend = get_search_backend()
+    results = backend.search(qs, query, title_weight, content_weight)
+    if not fuzzy or not backend.supports_fuzzy:
+        return results
+    # Unordered and without relevance nor snippet, so that the database
+    # stops at the first matches and computes nothing for them.
+    matched_ids = list(results.order_by().values_list("id", flat=True)[:FUZZY_MIN_RESULTS])
+    if len(matched_ids) >= FUZZY_MIN_RESULTS:
+        return results
+    similar_ids = [document_id for document_id in find_similar_titles(qs, query, backend) if document_id not in matched_ids]
+    if not similar_ids:
+        return results
+    matches = sorted(results.filter(id__in=matched_ids).values_list("relevance", "id", "snippet"))
+    ids = [document_id for _, document_id, _ in matches] + similar_ids
+    return qs.filter(id__in=ids).annotate(
+        relevance=models.Case(
+            *[models.When(id=document_id, then=Value(float(i))) for i, document_id in enumerate(ids)],
+            output_field=models.FloatField()),
+        snippet=models.Case(
+            *[models.When(id=document_id, then=Value(snippet)) for _, document_id, snippet in matches],
+            default=Value(""),
+            output_field=models.TextField()))
+
+
+def format_snippet(snippet: str) -> SafeString:
+    """Escape a snippet and highlight its matched terms."""
+    html = escape(snippet).replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>")
+    return mark_safe(html)
@@ -1466,6 +1466,7 @@ class Map {
         this.tileLayer = null;
         this.buttonSave = null;
         this.etag = etag;
+        this.savedContent = null;
         this.layersContainer = null;
         this.distanceLine = null;
         this.contextMenu = null;
@@ -1980,14 +1981,19 @@ class Map {
         if (this.readonly) return;
         let mapExport = this.export();
         var self = this;
-        post(
-            "", {
-                title: this.title,
-                content: mapExport.geojson,
-                config: mapExport.config,
-                action: "continue"
-            }, this.etag, (etag) => {self.etag = etag})
+        const data = {
+            title: this.title,
+            config: mapExport.config,
+            action: "continue"
+        };
+        if (this.savedContent == null) {
+            data.content = mapExport.geojson;
+        } else {
+            data.patch = JSON.stringify(computeLinePatch(this.savedContent, mapExport.geojson));
+        }
+        post("", data, this.etag, (etag) => {self.etag = etag})
             .then(res => {
+                self.savedContent = mapExport.geojson;
                 showToast("Saved map");
                 self.buttonSave.setAttribute("disabled", "");
             })
@@ -2292,6 +2298,7 @@ function initializeMap(mapLayout, readonly) {
     let mapNonce = mapLayout.getAttribute("map-nonce");
     getEtag("?format=json").then(({etag, data}) => {
         map = new Map(mapNonce, mapLayout, etag, readonly);
+        map.savedContent = data.content;
         let geojson = null;
         if (data.content != null && data.content.trim() != "") {
             try {
@@ -1,5 +1,9 @@
 const TOC_SCROLL_MARGIN_TOP = 48; // px
 
+function ownElements(container, selector) {
+    return Array.from(container.querySelectorAll(selector)).filter(element => element.closest(".embed-note") == null);
+}
+
 function createToc(contentContainer, tocContainer) {
     function removeToc() {
         remove(tocContainer.parentElement.parentElement);
@@ -9,7 +13,7 @@ function createToc(contentContainer, tocContainer) {
         removeToc();
         return;
     };
-    let titles = contentContainer.querySelectorAll("h2");
+    let titles = ownElements(contentContainer, "h2");
     if (titles.length < 2) {
         removeToc();
         return;
@@ -69,7 +73,7 @@ function bindWidgets() {
         widgetUpdateTimeout = setTimeout(submitWidgetUpdates, WIDGET_UPDATE_TIMEOUT);
     }
 
-    document.querySelectorAll(".widget-status").forEach((widget, index) => {
+    ownElements(document, ".widget-status").forEach((widget, index) => {
         widget.setAttribute("index", index);
         widget.addEventListener("click", () => {
             let newTextContent = null;
@@ -85,14 +89,14 @@ function bindWidgets() {
         });
     });
 
-    document.querySelectorAll(".widget-checkbox").forEach((widget, index) => {
+    ownElements(document, ".widget-checkbox").forEach((widget, index) => {
         widget.setAttribute("index", index);
         widget.addEventListener("input", () => {
             updateWidget("checkbox", index, widget.checked);
         });
     });
 
-    document.querySelectorAll(".widget-color-round").forEach((widget, index) => {
+    ownElements(document, ".widget-color-round").forEach((widget, index) => {
         widget.setAttribute("index", index);
         widget.addEventListener("click", () => {
             const color = ["🔴", "🟠", "🟡", "🟢", "🔵", "🟣", "🟤", "⚫", "⚪"];
@@ -104,7 +108,7 @@ function bindWidgets() {
         });
     });
 
-    document.querySelectorAll(".widget-color-square").forEach((widget, index) => {
+    ownElements(document, ".widget-color-square").forEach((widget, index) => {
         widget.setAttribute("index", index);
         widget.addEventListener("click", () => {
             const color = ["🟥", "🟧", "🟨", "🟩", "🟦", "🟪", "🟫", "⬛", "⬜"];
@@ -32,12 +32,6 @@ function addDays(baseDate, daysToAdd) {
     return newDate;
 }
 
-function daysDiff(a, b) {
-    const utc1 = Date.UTC(a.getFullYear(), a.getMonth(), a.getDate());
-    const utc2 = Date.UTC(b.getFullYear(), b.getMonth(), b.getDate());
-    return Math.round((utc2 - utc1) / 1000 / 3600 / 24);
-}
-
 class Slot {
 
     constructor(start, length, state, early=false, late=false) {
@@ -57,116 +51,30 @@ class Slot {
 class Objective {
 
     constructor(data) {
+        this.update(data);
+    }
+
+    update(data) {
         this.url = data.url;
         this.name = data.name;
         this.history = data.history;
-        if (this.history == null) {
-            this.history = [];
-        }
         this.period = data.period;
         this.flexible = data.flexible;
         this.archived = data.archived;
-        this.history.sort();
-    }
-
-    getSlots(startHours) {
-        
-        const today = new Date();
-        if (today.getHours() < startHours) {
-            today.setTime(today.getTime() - DAYMS);
-        }
-        today.setHours(startHours, 0, 0, 0);
-
-        if (this.history == null || this.history.length == 0) {
-            return [new Slot(today, 1, SLOT_STATE_BUTTON)];
-        }
-        const completions = [];
-        for (const ts of this.history) {
-            let date = new Date(ts * 1000);
-            if (date.getHours() < startHours) {
-                date = addDays(date, -1);
-            }
-            date.setHours(startHours, 0, 0, 0);
-            completions.push(date);
-        }
-        let n = this.history.length, i = 0, early = false, late = false, preset = false;
-        let slots = [];
-        let dateStart = completions[0];
-        while (dateStart < YEAR_END - DAYMS) {
-            let presetUsed = false;
-            while (i < n && completions[i] < dateStart) {
-                i++;
-            }
-            let dateEnd = addDays(dateStart, this.period);
-            let cut = false;
-            if (this.flexible) {
-                if (early) {
-                    dateEnd = addDays(dateStart, 1);
-                    preset = true;
-                } else if (late) {
-                    dateEnd = addDays(dateStart, 1);
-                } else if (preset) {
-                    let length = this.period - slots[slots.length - 2].length - 1;
-                    if (length > 0) {
-                        presetUsed = true;
-                        dateEnd = addDays(dateStart, length);
-                    }
-                } else {
-                    for (let j = i; j < n; j++) {
-                        if (completions[j] > dateStart && completions[j] < dateEnd) {
-                            dateEnd = completions[j];
-                            break;
-                        }
-                        if (completions[j] >= dateEnd) break;
-                    }
-                    if (today > dateStart && today < dateEnd) {
-                        cut = true;
-                        dateEnd = today;
-                    }
-                }
-            }
-            let completed = i < n && completions[i] < dateEnd;
-            let state = SLOT_STATE_MISSED;
-            if (presetUsed) {
-                state = SLOT_STATE_FUTURE_COMPLETE;
-            } else if (completed) {
-                state = SLOT_STATE_COMPLETE;
-            } else if (today >= dateStart && today < dateEnd) {
-                state = SLOT_STATE_BUTTON;
-            } else if (today < dateStart) {
-                state = SLOT_STATE_FUTURE;
-            }
-            if (this.flexible && state == SLOT_STATE_BUTTON) {
-                dateEnd = addDays(dateStart, 1);
-            }
-            let slot = new Slot(dateStart, daysDiff(dateStart, dateEnd), state, early, late);
-            slots.push(slot);
-            dateStart = dateEnd;
-            if (!early) {
-                preset = false;
-            }
-            if (cut) {
-                if (completed) {
-                    early = true;
-                } else {
-                    late = true;
-                }
-            } else {
-                early = false;
-                late = false;
-            }
-        }
-
-        return slots;
+        this.status = data.status;
+        this.streak = data.streak;
+        this.due = data.due;
+        this.slots = data.slots.map(([start, length, state, early, late]) => new Slot(start * 1000, length, state, early, late));
     }
 
 }
 
 function onObjectiveCheck(objective, onSubmit) {
     const ts = Math.floor((new Date()).getTime() / 1000);
-    objective.history.push(ts);
     post(objective.url, {action: "add-completion", ts: ts})
-        .then(res => {showToast("Saved objective history"); onSubmit();})
+        .then(res => fetch(objective.url + "?format=json"))
+        .then(res => res.json())
+        .then(data => {objective.update(data); showToast("Saved objective history"); onSubmit();})
         .catch(msg => {showToast(msg, true)});    
 }
 
@@ -180,14 +88,30 @@ function resetObjectivesScroll(container) {
     }
 }
 
+function inflateObjectiveName(nameEl, objective) {
+    nameEl.textContent = objective.name;
+    if (objective.streak > 0) {
+        const streakEl = create(nameEl, "span", "objective-streak");
+        streakEl.innerHTML = `<i class="ri-fire-line"></i> ${objective.streak}`;
+    }
+    const title = [];
+    if (objective.status == SLOT_STATE_COMPLETE || objective.status == SLOT_STATE_FUTURE_COMPLETE) {
+        title.push("Done for this period");
+    }
+    if (objective.due != null) {
+        title.push(`Next due ${(new Date(objective.due * 1000)).toLocaleString()}`);
+    }
+    title.push(`Streak of ${objective.streak} period${objective.streak == 1 ? "" : "s"}`);
+    nameEl.title = title.join("\n");
+}
+
 function inflateObjective(container, objective, rowIndex, startHours) {
 
     function inflateObjectiveElement(element) {
 
         element.innerHTML = "";
         
-        const slots = objective.getSlots(startHours);
-        slots.forEach(slot => {
+        objective.slots.forEach(slot => {
             if (dayOffset(slot.start) + DAYW * slot.length < 0) return;
             const slotEl = create(element, "div", "objective-slot");
             slotEl.style.width = `${DAYW * slot.length}px`;
@@ -218,6 +142,7 @@ function inflateObjective(container, objective, rowIndex, startHours) {
                 buttonCheck.addEventListener("click", () => {
                     onObjectiveCheck(objective, () => {
                         inflateObjectiveElement(element);
+                        inflateObjectiveName(nameEl, objective);
                     });
                 });
             }
@@ -245,7 +170,7 @@ function inflateObjective(container, objective, rowIndex, startHours) {
     if (objective.archived) {
         nameEl.classList.add("archived");
     }
-    nameEl.textContent = objective.name;
+    inflateObjectiveName(nameEl, objective);
     nameEl.style.top = ((rowIndex + 1) * 32) + "px";
     nameEl.addEventListener("click", (event) => {
         window.location.href = objective.url;
@@ -70,6 +70,29 @@ async function post(url, data, etag=null, onEtag=null) {
         });
 }
 
+/**
+ * Line-range operations turning a text into another, sent as `patch`
+ * @param {string} before
+ * @param {string} after
+ * @returns {Array<Object>}
+ */
+function computeLinePatch(before, after) {
+    const linesBefore = before.split("\n");
+    const linesAfter = after.split("\n");
+    let start = 0;
+    while (start < linesBefore.length && start < linesAfter.length && linesBefore[start] == linesAfter[start]) {
+        start++;
+    }
+    let endBefore = linesBefore.length;
+    let endAfter = linesAfter.length;
+    while (endBefore > start && endAfter > start && linesBefore[endBefore - 1] == linesAfter[endAfter - 1]) {
+        endBefore--;
+        endAfter--;
+    }
+    if (start == endBefore && start == endAfter) return [];
+    return [{start: start, end: endBefore, lines: linesAfter.slice(start, endAfter)}];
+}
+
 async function getEtag(url) {
     return fetch(url, {cache: "no-cache"})
         .then(async response => {
@@ -198,10 +221,39 @@ function bindSearch(searchEl, suggestionsUrl, suggestionsParams, onElementClick)
 
 }
 
+/**
+ * Fill the placeholders of embedded notes with their content, inlined by the
+ * server in `options.embeds`. Notes that are not available, or nested more
+ * than one level deep, fall back on an iframe.
+ * @param {HTMLElement} element
+ * @param {object} options
+ */
+function fillEmbeddedNotes(element, options) {
+    for (const placeholder of element.querySelectorAll(".embed-note")) {
+        const nonce = placeholder.getAttribute("embed-nonce");
+        const target = placeholder.querySelector(".card-note");
+        const nested = placeholder.parentElement.closest(".embed-note") != null;
+        const embed = (options.embeds == null || nested) ? undefined : options.embeds[nonce];
+        if (embed == undefined) {
+            const iframe = document.createElement("iframe");
+            iframe.src = `${nonce}?embed=1`;
+            target.replaceWith(iframe);
+        } else if (embed.html != null) {
+            target.innerHTML = embed.html;
+        } else {
+            target.textContent = embed.content;
+            markdownToHtmlFancy(target, {useKatex: options.useKatex, fetchReferences: options.fetchReferences});
+        }
+    }
+    element.querySelectorAll(".embed-note .widget-checkbox").forEach(checkbox => {checkbox.disabled = true});
+}
+
 function markdownToHtmlFancy(element, options) {
     if (!("useKatex" in options)) options.useKatex = false;
     if (!("embed" in options)) options.embed = false;
     if (!("fetchReferences" in options)) options.fetchReferences = false;
+    if (!("prerendered" in options)) options.prerendered = false;
+    if (!("embeds" in options)) options.embeds = null;
     const extensions = [];
     if (options.useKatex) {
         extensions.push(
@@ -220,7 +272,12 @@ function markdownToHtmlFancy(element, options) {
         extensions.push(
             {
                 type: "output",
-                regex: /@embed(note|sheet|map)\/([a-zA-Z0-9]+)/g,
+                regex: /@embednote\/([a-zA-Z0-9]+)/g,
+                replace: `<div class="iframe-container embed-note" embed-nonce="$1"><div class="card-note"></div><div class="iframe-actions"><a class="button" href="$1"><i class="ri-arrow-right-circle-line"></i> View note</a></div></div>`
+            },
+            {
+                type: "output",
+                regex: /@embed(sheet|map)\/([a-zA-Z0-9]+)/g,
                 replace: `<div class="iframe-container"><iframe src="$2?embed=1"></iframe><div class="iframe-actions"><a class="button" href="$2"><i class="ri-arrow-right-circle-line"></i> View $1</a></div></div>`
             }
         );
@@ -355,13 +412,19 @@ function markdownToHtmlFancy(element, options) {
             }
         ]
     });
-    element.innerHTML = converter.makeHtml(element.innerHTML.replaceAll("&gt;", ">"));
-    element.querySelectorAll("p").forEach(paragraph => {
-        paragraph.innerHTML = paragraph.innerHTML.replace(/(\w) ([:\?!;»€°])/g, "$1 $2").replace(/([«°]) (\w)/g, "$1 $2");;
-    });
+    if (!options.prerendered) {
+        element.innerHTML = converter.makeHtml(element.innerHTML.replaceAll("&gt;", ">"));
+        element.querySelectorAll("p").forEach(paragraph => {
+            paragraph.innerHTML = paragraph.innerHTML.replace(/(\w) ([:\?!;»€°])/g, "$1 $2").replace(/([«°]) (\w)/g, "$1 $2");;
+        });
+    }
+
+    if (options.embed) {
+        fillEmbeddedNotes(element, options);
+    }
 
     const referenceElements = element.querySelectorAll(".reference");
-    if (referenceElements.length > 0) {
+    if (referenceElements.length > 0 && options.documentsUrl) {
         const getParams = new URLSearchParams();
         getParams.append("part", "snippet");
         const referenceMap = new Map();
@@ -401,6 +464,7 @@ function markdownToHtmlFancy(element, options) {
     });
 
     for (const pre of element.querySelectorAll("pre")) {
+        if (pre.querySelector(":scope > button") != null) continue;
         const copyButton = create(pre, "button");
         copyButton.innerHTML = `<i class="ri-file-copy-2-line"></i>`;
         copyButton.onclick = () => {
@@ -435,6 +499,7 @@ function markdownToHtml(selector, options) {
     if (options == undefined) options = {};
     if (!("fancy" in options)) options.fancy = false;
     document.querySelectorAll(selector).forEach(element => {
+        if (element.closest(".embed-note") != null) return;
         if (options.fancy) {
             markdownToHtmlFancy(element, options);
         } else {
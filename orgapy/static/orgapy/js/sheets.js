@@ -1582,6 +1582,7 @@ class Sheet {
     constructor(nonce, container, etag, readonly=false) {
         this.nonce = nonce;
         this.etag = etag;
+        this.savedContent = null;
 
         // Config
         this.width = 4;
@@ -3222,8 +3223,14 @@ class Sheet {
 
     saveData() {
         const sheetExport = this.export();
-        post("", {content: sheetExport.data, config: sheetExport.config, action: "continue"}, this.etag, (newEtag) => {this.etag = newEtag})
-            .then(res => { showToast("Saved sheet"); this.toolbarButtonSave.setAttribute("disabled", "")})
+        const data = {config: sheetExport.config, action: "continue"};
+        if (this.savedContent == null) {
+            data.content = sheetExport.data;
+        } else {
+            data.patch = JSON.stringify(computeLinePatch(this.savedContent, sheetExport.data));
+        }
+        post("", data, this.etag, (newEtag) => {this.etag = newEtag})
+            .then(res => { this.savedContent = sheetExport.data; showToast("Saved sheet"); this.toolbarButtonSave.setAttribute("disabled", "")})
             .catch(msg => {showToast(msg, true)});
     }
 
@@ -3234,6 +3241,7 @@ function initializeSheet(sheetSeed, readonly) {
     const sheetNonce = sheetSeed.getAttribute("sheet-nonce");
     getEtag("?format=json").then(({etag, data}) => {
         sheet = new Sheet(sheetNonce, sheetSeed, etag, readonly);
+        sheet.savedContent = data.content;
         let body = null;
         if (data.content != null && data.content.trim() != "") {
             body = parseTsv(data.content);
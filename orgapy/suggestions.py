@@ -0,0 +1,76 @@
+import collections
+import threading
+import time
+
+
+SUGGESTION_CACHE_TIMEOUT = 30
+SUGGESTION_CACHE_MAX_ENTRIES_PER_USER = 64
+TITLE_KEY_LENGTH = 255
+
+
+def get_title_key(title: str | None) -> str:
+    """Normalized title, matched against suggestion prefixes."""
+    return (title or "").strip().lower()[:TITLE_KEY_LENGTH]
+
+
+class SuggestionCache:
+    """Remember recent suggestions per user within a process, so that
+    successive keystrokes are answered without querying the database.
+
+    Entries are keyed by suggestion type and prefix, and hold the matched
+    keys of each result along with its payload. A list shorter than the
+    limit it was fetched with holds every match of its prefix, so it also
+    answers longer prefixes, by filtering it in memory. Entries expire after
+    `SUGGESTION_CACHE_TIMEOUT` seconds, and are dropped when the user saves
+    a document or a project.
+    """
+
+    def __init__(self, timeout: float = SUGGESTION_CACHE_TIMEOUT, max_entries_per_user: int = SUGGESTION_CACHE_MAX_ENTRIES_PER_USER):
+        self.timeout = timeout
+        self.max_entries_per_user = max_entries_per_user
+        self.entries: dict[int, collections.OrderedDict[tuple[str, str], tuple[float, int, list[tuple[list[str], dict]]]]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id: int, stype: str, prefix: str, limit: int) -> list[dict] | None:
+        now = time.monotonic()
+        with self.lock:
+            entries = self.entries.get(user_id)
+            if entries is None:
+                return None
+            for length in range(len(prefix), 0, -1):
+                key = (stype, prefix[:length])
+                entry = entries.get(key)
+                if entry is None:
+                    continue
+                created, entry_limit, results = entry
+                if now - created > self.timeout:
+                    del entries[key]
+                    continue
+                complete = len(results) < entry_limit
+                if length == len(prefix) and (complete or limit <= entry_limit):
+                    entries.move_to_end(key)
+                    return [payload for _, payload in results[:limit]]
+                if complete:
+                    entries.move_to_end(key)
+                    matches = [payload for keys, payload in results if any(k.startswith(prefix) for k in keys)]
+                    return matches[:limit]
+        return None
+
+    def set(self, user_id: int, stype: str, prefix: str, limit: int, results: list[tuple[list[str], dict]]):
+        with self.lock:
+            entries = self.entries.setdefault(user_id, collections.OrderedDict())
+            entries[(stype, prefix)] = (time.monotonic(), limit, results)
+            entries.move_to_end((stype, prefix))
+            while len(entries) > self.max_entries_per_user:
+                entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+suggestion_cache = SuggestionCache()
@@ -0,0 +1,95 @@
+import datetime
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Iterable
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Calendar
+
+
+logger = logging.getLogger(__name__)
+
+SYNC_WORKERS = 4
+SYNC_TIMEOUT = 30
+SYNC_LOCK_TIMEOUT = 5 * SYNC_TIMEOUT
+SYNC_BACKOFF_BASE = 60
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Created lazily so that pre-forking servers do not share it.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix="orgapy-sync")
+        return _executor
+
+
+def _lock_key(calendar_id: int) -> str:
+    return f"orgapy:calendar-sync:{calendar_id}"
+
+
+def is_sync_due(calendar: Calendar, now: datetime.datetime) -> bool:
+    """A calendar is due once its sync period has passed. After failed
+    attempts, retries are spaced exponentially, up to the sync period."""
+    if calendar.sync_failures > 0:
+        delay = min(SYNC_BACKOFF_BASE * 2 ** (calendar.sync_failures - 1), calendar.sync_period)
+        reference = calendar.last_sync_attempt
+    else:
+        delay = calendar.sync_period
+        reference = calendar.last_sync
+    return reference is None or (now - reference).total_seconds() > delay
+
+
+def _sync(calendar_id: int):
+    try:
+        calendar = Calendar.objects.select_related("user__settings").get(id=calendar_id)
+        calendar.last_sync_attempt = timezone.now()
+        try:
+            calendar.fetch_events(timeout=SYNC_TIMEOUT)
+        except Exception:
+            logger.exception("Could not sync calendar %s", calendar_id)
+            Calendar.objects.filter(id=calendar_id).update(
+                sync_failures=F("sync_failures") + 1,
+                last_sync_attempt=calendar.last_sync_attempt)
+            raise
+        if calendar.sync_failures > 0:
+            Calendar.objects.filter(id=calendar_id).update(sync_failures=0)
+    finally:
+        cache.delete(_lock_key(calendar_id))
+        connections.close_all()
+
+
+def schedule_sync(calendars: Iterable[Calendar], force: bool = False) -> list[Future]:
+    """Submit the calendars that are due to the background worker pool and
+    return immediately. A calendar already being synced, by this process or
+    another one sharing the cache, is skipped."""
+    now = timezone.now()
+    futures = []
+    for calendar in calendars:
+        if not force and not is_sync_due(calendar, now):
+            continue
+        if not cache.add(_lock_key(calendar.id), True, SYNC_LOCK_TIMEOUT):
+            continue
+        try:
+            futures.append(_get_executor().submit(_sync, calendar.id))
+        except Exception:
+            cache.delete(_lock_key(calendar.id))
+            raise
+    return futures
+
+
+def sync_calendars(calendars: Iterable[Calendar], force: bool = False) -> tuple[int, int]:
+    """Sync calendars concurrently and wait for completion. Return the number
+    of successful and failed syncs."""
+    futures = schedule_sync(calendars, force=force)
+    done, not_done = wait(futures, timeout=SYNC_LOCK_TIMEOUT)
+    failures = len(not_done) + sum(1 for future in done if future.exception() is not None)
+    return len(futures) - failures, failures
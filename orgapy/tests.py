@@ -1,3 +1,825 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import logging
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import urllib.request
+from concurrent.futures import wait
+from unittest import mock
 
-# Create your tests here.
+import caldav
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import objectives as objectives_module
+from . import rendering
+from . import sync
+from .clients import client_pool
+from .models import Calendar, CalendarEvent, Document, Objective, ObjectiveCompletion, ProgressLog, Project, Settings, Tag, Task, nonce_allocator
+from .rendering import get_embedded_notes, render_markdown, render_note
+from .search import SNIPPET_END, SNIPPET_START, ContainsSearchBackend, PostgresSearchBackend, build_fts_query, build_trigram_query, build_tsquery, search_documents
+from .suggestions import suggestion_cache
+from .utils import get_newly_checked_items
+
+
+class DocumentListQueryCountTests(TestCase):
+
+    QUERIES_PER_PAGE = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        tags = [Tag.objects.create(user=cls.user, name=f"tag{i}") for i in range(3)]
+        for i in range(40):
+            doc = Document.objects.create(user=cls.user, title=f"Document {i}")
+            doc.tags.add(*tags[:i % 4])
+            if i % 3 == 0:
+                Project.objects.create(user=cls.user, document=doc, title=f"Project {i}")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        for size in [1, 10, 40]:
+            with self.assertNumQueries(self.QUERIES_PER_PAGE):
+                response = self.client.get(reverse("orgapy:documents"), {"size": size})
+            self.assertEqual(len(response.context["objects"]), size)
+
+    def test_query_count_cursor_pagination(self):
+        for size in [1, 10, 40]:
+            cache.clear()
+            with self.assertNumQueries(self.QUERIES_PER_PAGE):
+                self.client.get(reverse("orgapy:documents"), {"size": size, "pagination": "cursor"})
+
+    def test_ongoing_projects_flag(self):
+        response = self.client.get(reverse("orgapy:documents"), {"size": 40})
+        for doc in response.context["objects"]:
+            self.assertEqual(doc.has_ongoing_projects, doc.get_ongoing_projects().exists())
+
+
+class DocumentSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        Document.objects.create(user=cls.user, title="Tomato garden", content="Notes about <b>tomatoes</b>")
+        for i in range(30):
+            Document.objects.create(user=cls.user, title=f"Document {i}", content="word " * i + "tomato salad")
+        Document.objects.create(user=cls.user, title="Other", content="Nothing to see")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_pagination_and_ordering_happen_in_sql(self):
+        response = self.client.get(reverse("orgapy:documents"), {"query": "tomato", "sort": "relevance", "size": 10})
+        page = response.context["objects"]
+        self.assertEqual(page.paginator.count, 31)
+        self.assertEqual(page[0].title, "Tomato garden")
+        relevances = [doc.relevance for doc in page]
+        self.assertEqual(relevances, sorted(relevances))
+        response = self.client.get(reverse("orgapy:documents"), {"query": "tomato", "sort": "relevance", "size": 10, "pagination": "cursor"})
+        self.assertEqual([doc.title for doc in response.context["objects"]], [doc.title for doc in page])
+
+    def test_snippets_are_highlighted(self):
+        response = self.client.get(reverse("orgapy:documents"), {"query": "tomato", "sort": "relevance"})
+        self.assertEqual(response.context["objects"][0].snippet, "Notes about &lt;b&gt;<mark>tomatoes</mark>&lt;/b&gt;")
+        self.assertContains(response, "<mark>tomato</mark> salad")
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "the full-text index is specific to SQLite")
+    def test_index_drives_the_join(self):
+        qs = search_documents(Document.objects.filter(user=self.user, deleted=False), "tomato")
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = [row[3] for row in cursor.fetchall()]
+        self.assertTrue(plan[0].startswith("SCAN orgapy_document_fts"), plan)
+
+    @override_settings(ORGAPY_SEARCH_BACKEND="icontains")
+    def test_fallback_backend(self):
+        response = self.client.get(reverse("orgapy:documents"), {"query": "tomato", "sort": "relevance", "size": 50})
+        page = response.context["objects"]
+        self.assertEqual(page.paginator.count, 31)
+        self.assertEqual(page[0].title, "Tomato garden")
+        self.assertEqual(page[0].snippet, "")
+
+    def test_query_syntax(self):
+        self.assertEqual(build_fts_query('tomato "green salad"'), '"green salad" tomato*')
+        self.assertEqual(build_tsquery('tomato "green salad"'), '(green <-> salad) & tomato:*')
+        self.assertEqual(build_trigram_query("Tomato"), '"tom" OR "oma" OR "mat" OR "ato"')
+
+    def test_typos_fall_back_to_similar_titles(self):
+        response = self.client.get(reverse("orgapy:documents"), {"query": "tomatoo gardn", "sort": "relevance"})
+        self.assertEqual([doc.title for doc in response.context["objects"]], ["Tomato garden"])
+        self.assertEqual(self.get_titles("Othr"), ["Other"])
+        self.assertEqual(self.get_titles("zzzz"), [])
+
+    def test_fuzzy_fallback_is_skipped_when_enough_documents_match(self):
+        with mock.patch("orgapy.search.find_similar_titles") as find_similar_titles:
+            self.assertEqual(len(self.get_titles("salad")), 30)
+            find_similar_titles.assert_not_called()
+            self.get_titles("nothing")
+            find_similar_titles.assert_called_once()
+
+    def test_fuzzy_fallback_is_skipped_without_trigram_index(self):
+        with self.assertNumQueries(0):
+            qs = search_documents(Document.objects.all(), "tomatoo", backend=ContainsSearchBackend())
+        self.assertEqual(list(qs), [])
+
+    def get_titles(self, query: str) -> list[str]:
+        return [doc.title for doc in search_documents(Document.objects.all(), query).order_by("relevance", "id")]
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "the database is not PostgreSQL")
+class PostgresSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        cls.title_match = Document.objects.create(user=cls.user, title="Tomato garden", content="Notes")
+        cls.content_match = Document.objects.create(user=cls.user, title="Salad", content="Fresh tomatoes and <b>basil</b>")
+        Document.objects.create(user=cls.user, title="Other", content="Nothing to see")
+
+    def search(self, query: str) -> list[Document]:
+        qs = search_documents(Document.objects.filter(user=self.user), query, backend=PostgresSearchBackend(), fuzzy=False)
+        return list(qs.order_by("relevance", "id"))
+
+    def test_titles_rank_first(self):
+        results = self.search("tomato")
+        self.assertEqual(results, [self.title_match, self.content_match])
+        self.assertIn(f"{SNIPPET_START}tomatoes{SNIPPET_END}", results[1].snippet)
+        self.assertEqual(self.search('"tomato garden"'), [self.title_match])
+
+    def test_search_vector_follows_content(self):
+        self.content_match.content = "Zucchinis"
+        self.content_match.save()
+        self.assertEqual(self.search("zucchini"), [self.content_match])
+        self.assertEqual(self.search("basil"), [])
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "only the SQLite index needs maintenance")
+class SearchIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        cls.doc = Document.objects.create(user=cls.user, title="Garden", content="Tomatoes and zucchinis")
+
+    def search(self, query: str) -> list[Document]:
+        return list(search_documents(Document.objects.all(), query))
+
+    def test_edited_terms_leave_the_index(self):
+        self.doc.content = "Potatoes"
+        self.doc.save()
+        self.assertEqual(self.search("tomatoes"), [])
+        self.assertEqual(self.search("potatoes"), [self.doc])
+        call_command("orgapy_search_index", "check", stdout=io.StringIO())
+
+    def test_rebuild_indexes_missing_documents(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER document_ai")
+        doc = Document.objects.create(user=self.user, title="Orchard")
+        with self.assertRaisesMessage(CommandError, "missing 1 document"):
+            call_command("orgapy_search_index", "check", stdout=io.StringIO())
+        call_command("orgapy_search_index", "rebuild", stdout=io.StringIO())
+        call_command("orgapy_search_index", "check", stdout=io.StringIO())
+        self.assertEqual(self.search("orchard"), [doc])
+
+    def test_full_rebuild_and_merges(self):
+        out = io.StringIO()
+        call_command("orgapy_search_index", "rebuild", "--full", stdout=out)
+        call_command("orgapy_search_index", "merge", stdout=out)
+        call_command("orgapy_search_index", "optimize", stdout=out)
+        call_command("orgapy_search_index", "stats", stdout=out)
+        self.assertEqual(out.getvalue().count("Indexed:      1"), 2)
+        self.assertEqual(self.search("zucchinis"), [self.doc])
+        self.assertEqual(self.search("Gardne"), [self.doc])
+
+
+class TagCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        cls.tags = [Tag.objects.create(user=cls.user, name=f"tag{i}") for i in range(5)]
+        for i in range(10):
+            doc = Document.objects.create(user=cls.user, title=f"Document {i}", deleted=i >= 8)
+            doc.tags.add(*cls.tags[:i % 5])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_counts_use_a_single_query(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("orgapy:tags"), {"format": "json", "sort": "count"})
+        data = response.json()
+        self.assertEqual(
+            [(tag["name"], tag["count"]) for tag in data["tags"]],
+            [(tag.name, tag.documents.count()) for tag in sorted(self.tags, key=lambda t: (-t.documents.count(), t.name))])
+
+    def test_exclude_deleted(self):
+        response = self.client.get(reverse("orgapy:tags"), {"format": "json", "exclude": "deleted"})
+        counts = {tag["name"]: tag["count"] for tag in response.json()["tags"]}
+        for tag in self.tags:
+            self.assertEqual(counts[tag.name], tag.documents.filter(deleted=False).count())
+
+    def test_rename_onto_existing_tag_merges_them(self):
+        documents = set(self.tags[1].documents.all()) | set(self.tags[4].documents.all())
+        response = self.client.post(reverse("orgapy:tag", args=["tag4"]), {"name": "Tag1"})
+        self.assertRedirects(response, reverse("orgapy:tag", args=["tag1"]), fetch_redirect_response=False)
+        self.assertFalse(Tag.objects.filter(id=self.tags[4].id).exists())
+        self.assertEqual(set(self.tags[1].documents.all()), documents)
+
+
+class SuggestionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        now = timezone.now()
+        cls.old = Document.objects.create(user=cls.user, title="Tomato Garden", date_access=now - datetime.timedelta(days=2))
+        cls.recent = Document.objects.create(user=cls.user, title="tomato salad", date_access=now)
+        Document.objects.create(user=cls.user, title="Tomorrow", date_access=now - datetime.timedelta(days=1))
+        Document.objects.create(user=cls.user, title="Tomato sauce", deleted=True)
+        Project.objects.create(user=cls.user, title="Harvest", document=cls.old)
+        Tag.objects.create(user=cls.user, name="tomato")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        suggestion_cache.clear()
+
+    def get_labels(self, query: str, **params) -> list[str]:
+        response = self.client.get(reverse("orgapy:suggestions"), {"q": query, **params})
+        return [result["label"] for result in response.json()["results"]]
+
+    def test_prefix_is_case_insensitive_and_ranked_by_access(self):
+        self.assertEqual(self.get_labels("TOM"), ["tomato salad", "Tomorrow", "Tomato Garden"])
+        self.assertEqual(self.get_labels("#tom"), ["tomato"])
+        self.assertEqual(self.get_labels("tomato g", t="project"), ["Tomato Garden - Harvest"])
+
+    def test_longer_prefixes_are_served_from_cache(self):
+        self.get_labels("to")
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_labels("tomat"), ["tomato salad", "Tomato Garden"])
+        self.assertEqual(self.get_labels("tomat", l=1), ["tomato salad"])
+        with self.assertNumQueries(5):
+            self.get_labels("t", l=1)
+            self.get_labels("to", l=1)
+
+    def test_saving_a_document_invalidates_cache(self):
+        self.assertEqual(self.get_labels("tomato"), ["tomato salad", "Tomato Garden"])
+        self.recent.title = "Potato salad"
+        self.recent.save()
+        self.assertEqual(self.get_labels("tomato"), ["Tomato Garden"])
+
+    def test_restoring_the_trash_invalidates_cache(self):
+        self.assertEqual(self.get_labels("tomato"), ["tomato salad", "Tomato Garden"])
+        self.client.post(reverse("orgapy:trash"), {"restore": "on"})
+        self.assertEqual(self.get_labels("tomato"), ["Tomato sauce", "tomato salad", "Tomato Garden"])
+
+
+class DocumentSaveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        cls.targets = [Document.objects.create(user=cls.user, title=f"Target {i}") for i in range(5)]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.doc = Document.objects.create(user=self.user, title="Source")
+
+    def _post(self, data: dict):
+        data = {"etag": self.doc.etag, "action": "continue", **data}
+        return self.client.post(self.doc.get_absolute_url(), data, headers={"X-Requested-With": "XMLHttpRequest"})
+
+    def _save(self, data: dict):
+        self.doc.refresh_from_db()
+        response = self._post(data)
+        self.doc.refresh_from_db()
+        return response
+
+    def test_tag_sync_query_count_does_not_depend_on_tag_count(self):
+        for count in [2, 20]:
+            names = ";".join(f"tag{count}-{i}" for i in range(count))
+            self.doc.refresh_from_db()
+            with self.assertNumQueries(11):
+                response = self._post({"tags": names})
+            self.assertEqual(response.status_code, 204)
+            self.assertEqual(self.doc.tags.count(), count)
+        response = self._save({"tags": "tag2-0;Tag20-1; ;uncategorized"})
+        self.assertEqual(sorted(tag.name for tag in self.doc.tags.all()), ["tag2-0", "tag20-1"])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 22)
+
+    def test_reference_sync(self):
+        content = " ".join(f"@note/{target.nonce}" for target in self.targets[:3])
+        self._save({"content": content})
+        self.assertEqual(set(self.doc.references.all()), set(self.targets[:3]))
+        content = f"@embednote/{self.targets[2].nonce} @note/{self.targets[4].nonce} @note/zzzzzz"
+        self._save({"content": content})
+        self.assertEqual(set(self.doc.references.all()), {self.targets[2], self.targets[4]})
+
+    def test_patch(self):
+        self._save({"content": "a\tb\nc\td\ne\tf"})
+        self._save({"patch": json.dumps([{"start": 1, "end": 2, "lines": ["x\ty", "z\tw"]}])})
+        self.assertEqual(self.doc.content, "a\tb\nx\ty\nz\tw\ne\tf")
+        response = self._save({"patch": json.dumps([{"start": 3, "end": 9, "lines": []}])})
+        self.assertEqual(response.status_code, 400)
+
+    def test_patch_to_empty_content(self):
+        self._save({"content": "a\nb"})
+        response = self._save({"patch": json.dumps([{"start": 0, "end": 2, "lines": [""]}])})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.doc.content, "")
+        self._save({"patch": json.dumps([{"start": 0, "end": 1, "lines": ["c"]}])})
+        self.assertEqual(self.doc.content, "c")
+
+    def test_noop_save_skips_write(self):
+        self._save({"title": "Source", "content": "Hello", "config": "{}"})
+        etag = self.doc.etag
+        with CaptureQueriesContext(connection) as context:
+            self._save({"title": "Source", "patch": "[]", "config": "{}"})
+        self.assertEqual(self.doc.etag, etag)
+        self.assertFalse(any(query["sql"].startswith("UPDATE") for query in context.captured_queries))
+
+
+class NonceAllocationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+
+    def setUp(self):
+        nonce_allocator.pool.clear()
+
+    def test_nonces_are_checked_in_batches(self):
+        with self.assertNumQueries(1):
+            nonces = nonce_allocator.allocate(100)
+        self.assertEqual(len(set(nonces)), 100)
+        with self.assertNumQueries(0):
+            nonce_allocator.allocate()
+
+    def test_insert_retries_on_collision(self):
+        taken = Document.objects.create(user=self.user).nonce
+        nonce_allocator.pool.insert(0, taken)
+        doc = Document.objects.create(user=self.user)
+        self.assertNotEqual(doc.nonce, taken)
+
+
+class SnippetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        cls.docs = [Document.objects.create(user=cls.user, title=f"Document {i}") for i in range(20)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def _get(self, nonces: list[str]):
+        return self.client.get(reverse("orgapy:documents"), {"part": "snippet", "nonce": nonces})
+
+    def test_snippets_are_resolved_in_one_query(self):
+        nonces = [doc.nonce for doc in self.docs] + ["zzzzzz"]
+        with CaptureQueriesContext(connection) as context:
+            response = self._get(nonces)
+        self.assertEqual(sum("orgapy_document" in query["sql"] for query in context.captured_queries), 1)
+        results = response.json()["results"]
+        self.assertEqual([result["title"] for result in results[:-1]], [doc.title for doc in self.docs])
+        self.assertEqual(results[-1]["error"], "Invalid reference")
+        with CaptureQueriesContext(connection) as context:
+            self._get(nonces[:-1])
+        self.assertFalse(any("orgapy_document" in query["sql"] for query in context.captured_queries))
+
+    def test_destroyed_documents_are_invalidated(self):
+        doc = self.docs[0]
+        self.assertEqual(self._get([doc.nonce]).json()["results"][0]["title"], doc.title)
+        self.client.post(doc.get_absolute_url(), {"deleted": "on", "etag": doc.etag})
+        self.client.post(reverse("orgapy:trash"), {"destroy": "on"})
+        self.assertEqual(self._get([doc.nonce]).json()["results"][0]["error"], "Invalid reference")
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        cls.doc = Document.objects.create(user=cls.user, title="Document", content="Hello")
+        cls.project = Project.objects.create(user=cls.user, title="Project")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_document_revalidation_is_a_single_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.doc.get_absolute_url(), {"format": "json"}, headers={"If-None-Match": f'"{self.doc.etag}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("content", queries[0]["sql"])
+        self.assertNotIn("config", queries[0]["sql"])
+
+    def test_project_revalidation_is_a_single_query(self):
+        self.client.get(reverse("orgapy:home"))
+        with self.assertNumQueries(3): # session, user and project
+            response = self.client.get(self.project.get_absolute_url(), {"format": "json"}, headers={"If-None-Match": f'"{self.project.etag}"'})
+        self.assertEqual(response.status_code, 304)
+
+    def test_document_full_render(self):
+        with self.assertNumQueries(6): # validators, document, owner, session, user and access date
+            response = self.client.get(self.doc.get_absolute_url(), {"format": "json"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], f'"{self.doc.etag}"')
+
+
+class ProjectChecklistTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        for title, checklist in [("Empty", None), ("Half", "[x] a\n[ ] b"), ("Done", "[x] a\n[x] b\nnote [ ] c"), ("Started", "[ ] a\n[ ] b\n[x] c")]:
+            Project.objects.create(user=cls.user, title=title, checklist=checklist)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _titles(self, **params) -> list[str]:
+        response = self.client.get(reverse("orgapy:projects"), params)
+        return [project.title for project in response.context["projects"]]
+
+    def test_counts_are_stored_on_save(self):
+        project = Project.objects.get(title="Half")
+        self.assertEqual((project.items_count, project.completed_items_count, project.progress), (2, 1, 50))
+        self.assertTrue(Project.objects.get(title="Done").all_completed)
+        response = self.client.post(project.get_absolute_url(), {"checklist": "[x] a\n[x] b\n[ ] c", "etag": project.etag})
+        self.assertEqual(response.status_code, 302)
+        project.refresh_from_db()
+        self.assertEqual((project.items_count, project.completed_items_count), (3, 2))
+
+    def test_newly_checked_items(self):
+        before = "[ ] a\n[x] b\n[ ] c\n[x] d\n[ ] e"
+        self.assertEqual(get_newly_checked_items(before, before), [])
+        self.assertEqual(get_newly_checked_items(before, "[x] a\n[x] b\n[x] c\n[x] d\n[ ] e"), ["a", "c"])
+        self.assertEqual(get_newly_checked_items(before, "[ ] a\n[x] b2\n[ ] c\n[x] d\n[ ] e"), [])
+        self.assertEqual(get_newly_checked_items(before, "[x] d\n[ ] a\n[x] b\n[ ] c\n[ ] e"), [])
+        self.assertEqual(get_newly_checked_items(before, "[ ] a\n[x] b\n[x] f\n[ ] c\n[x] d\n[x] e2"), ["f", "e2"])
+
+    def test_checked_items_are_logged_in_one_insert(self):
+        project = Project.objects.create(user=self.user, title="Long", checklist="\n".join(f"[ ] item {i}" for i in range(50)))
+        checklist = "\n".join(f"[{'x' if i % 2 else ' '}] item {i}" for i in range(50))
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(project.get_absolute_url(), {"checklist": checklist, "etag": project.etag})
+        self.assertEqual(sum(query["sql"].startswith('INSERT INTO "orgapy_progresslog"') for query in context.captured_queries), 1)
+        self.assertEqual(ProgressLog.objects.filter(user=self.user, type=ProgressLog.PROJECT_CHECKLIST_ITEM_CHECKED).count(), 25)
+
+    def test_sort_and_filter_by_progress(self):
+        self.assertEqual(self._titles(sort="progress"), ["Done", "Half", "Started", "Empty"])
+        self.assertEqual(self._titles(progress="ongoing", sort="progress"), ["Half", "Started"])
+        self.assertEqual(self._titles(progress="done"), ["Done"])
+        self.assertEqual(self._titles(progress="empty"), ["Empty"])
+
+
+class NoteRenderingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        cls.embedded = [Document.objects.create(user=cls.user, title=f"Embedded {i}", content=f"# Part {i}", public=True) for i in range(3)]
+        content = "\n\n".join(f"@embednote/{doc.nonce}" for doc in cls.embedded)
+        cls.doc = Document.objects.create(user=cls.user, title="Document", content=content, public=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_embedded_notes_are_fetched_in_one_query(self):
+        with self.assertNumQueries(1):
+            embeds = get_embedded_notes(self.doc, owner_view=False)
+        self.assertEqual(set(embeds), {doc.nonce for doc in self.embedded})
+        if rendering.markdown is not None:
+            self.assertIn("Part 0</h2>", embeds[self.embedded[0].nonce]["html"])
+
+    def test_rendered_html_is_cached(self):
+        if rendering.markdown is None:
+            self.skipTest("markdown is not installed")
+        html = render_note(self.doc)
+        self.assertIn(f'embed-nonce="{self.embedded[0].nonce}"', html)
+        self.doc.content = "changed"
+        self.assertEqual(render_note(self.doc), html)
+        self.doc.updated_at = timezone.now()
+        self.assertIn("changed", render_note(self.doc))
+
+    def test_syntax_extensions_skip_code(self):
+        if rendering.markdown is None:
+            self.skipTest("markdown is not installed")
+        self.assertEqual(render_markdown("==a== `==b==`"), "<p><mark>a</mark> <code>==b==</code></p>")
+        html = render_markdown(":::details Summary\nHidden\n\n```\n:::details Code\n:::\n```\n:::")
+        self.assertEqual(html.count("<details>"), 1)
+        self.assertIn("<summary>Summary</summary>", html)
+        self.assertIn(":::details Code", html)
+        self.assertEqual(render_markdown("Oui ? « Non » `a : b`"), "<p>Oui\u00a0? «\u00a0Non\u00a0» <code>a : b</code></p>")
+
+    def test_public_note_is_served_prerendered(self):
+        response = self.client.get(self.doc.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["rendered"], render_note(self.doc))
+        self.assertEqual(len(response.context["embeds"]), 3)
+
+
+class CalendarSyncTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser("user", password="password")
+        self.calendars = [
+            Calendar.objects.create(user=self.user, url="http://localhost", username="user", password="password", calendar_name=f"Calendar {i}")
+            for i in range(4)
+        ]
+        self.client.force_login(self.user)
+
+    def test_home_does_not_wait_for_sync(self):
+        release = threading.Event()
+        futures = []
+        def schedule_sync(*args, **kwargs):
+            futures.extend(sync.schedule_sync(*args, **kwargs))
+            return futures
+        with mock.patch.object(Calendar, "fetch_events", side_effect=lambda timeout: release.wait(5)),\
+             mock.patch("orgapy.views.schedule_sync", side_effect=schedule_sync):
+            start = time.monotonic()
+            response = self.client.get(reverse("orgapy:home"))
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(futures), 4)
+            self.assertEqual(sync.schedule_sync(self.calendars, force=True), [])
+            release.set()
+            wait(futures)
+        self.assertTrue(all(future.exception() is None for future in futures))
+
+    def test_calendars_are_synced_concurrently(self):
+        with mock.patch.object(Calendar, "fetch_events", side_effect=lambda timeout: time.sleep(.3)):
+            start = time.monotonic()
+            self.assertEqual(sync.sync_calendars(self.calendars), (4, 0))
+            self.assertLess(time.monotonic() - start, 1.2)
+
+    def test_failures_back_off(self):
+        with self.assertLogs("orgapy.sync", "ERROR"), mock.patch.object(Calendar, "fetch_events", side_effect=OSError):
+            self.assertEqual(sync.sync_calendars(self.calendars[:1]), (0, 1))
+        calendar = Calendar.objects.get(id=self.calendars[0].id)
+        self.assertEqual(calendar.sync_failures, 1)
+        self.assertFalse(sync.is_sync_due(calendar, calendar.last_sync_attempt + datetime.timedelta(seconds=30)))
+        self.assertTrue(sync.is_sync_due(calendar, calendar.last_sync_attempt + datetime.timedelta(seconds=90)))
+
+    def test_sync_keeps_concurrent_edits(self):
+        Settings.objects.create(user=self.user)
+        calendar = Calendar.objects.select_related("user__settings").get(id=self.calendars[0].id)
+        Calendar.objects.filter(id=calendar.id).update(calendar_name="Renamed", sync_period=3600)
+        with mock.patch.object(Calendar, "_get_remote_calendar", return_value=None):
+            calendar.fetch_events()
+        calendar.refresh_from_db()
+        self.assertEqual((calendar.calendar_name, calendar.sync_period), ("Renamed", 3600))
+        self.assertIsNotNone(calendar.last_sync)
+
+
+class HomeEventsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        Settings.objects.create(user=cls.user, calendar_lookahead=2)
+        calendar = Calendar.objects.create(user=cls.user, url="http://localhost", username="user", password="password", calendar_name="Calendar", last_sync=timezone.now())
+        this_morning = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        for days, hours, title in [(-1, 10, "Past"), (0, 0, "All day"), (0, 10, "Today"), (1, 9, "Tomorrow"), (2, 9, "Later")]:
+            start = this_morning + datetime.timedelta(days=days, hours=hours)
+            CalendarEvent.objects.create(calendar=calendar, url=title, title=title, dtstart=start, dtend=start + datetime.timedelta(hours=1 if hours else 24), all_day=hours == 0)
+
+    def test_events_are_grouped_by_day(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("orgapy:home"))
+        groups = [[event["title"] for event in events] for _, events in response.context["event_groups"]]
+        self.assertEqual(groups, [["All day", "Today"], ["Tomorrow"]])
+
+
+class HomeTaskGroupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        Settings.objects.create(user=cls.user)
+        start = timezone.now().date() - datetime.timedelta(days=1)
+        Task.objects.create(user=cls.user, title="No date", start_date=start)
+        for days in range(-3, 80, 2):
+            Task.objects.create(user=cls.user, title=f"Task {days}", start_date=start, due_date=start + datetime.timedelta(days=days))
+
+    def test_expression_matches_get_group(self):
+        for days in range(0, 400, 5):
+            today = datetime.date(2024, 1, 1) + datetime.timedelta(days=days)
+            for task in Task.objects.annotate(group=Task.get_group_expression(today)):
+                self.assertEqual(task.group, task.get_group(today))
+
+    def test_tasks_are_grouped_by_due_date(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("orgapy:home"))
+        today = timezone.now().date()
+        groups = [(group["label"], [task.title for task in group["tasks"]]) for group in response.context["task_groups"]]
+        expected = {}
+        for task in Task.objects.order_by("due_date", "start_date"):
+            expected.setdefault(task.get_group(today), []).append(task.title)
+        self.assertEqual(groups, [(Task.GROUP_LABELS[group], titles) for group, titles in sorted(expected.items())])
+
+
+class RecurringTaskTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        cls.today = datetime.date(2024, 6, 15)
+
+    def _task(self, mode: str, period: int, start_date: datetime.date, **kwargs) -> Task:
+        return Task.objects.create(user=self.user, title="Task", start_date=start_date, recurring_mode=mode, recurring_period=period, **kwargs)
+
+    def test_catch_up_skips_missed_periods(self):
+        task = self._task(Task.DAILY, 3, datetime.date(2014, 6, 16), due_date=datetime.date(2014, 6, 17))
+        child = task.create_recurring_child(self.today)
+        self.assertEqual((child.start_date, child.due_date), (datetime.date(2024, 6, 17), datetime.date(2024, 6, 18)))
+        self.assertEqual(child.recurring_parent, task)
+        for mode, period, start_date, expected in [
+            (Task.DAILY, 1, datetime.date(2024, 6, 15), datetime.date(2024, 6, 16)),
+            (Task.WEEKLY, 2, datetime.date(2024, 5, 1), datetime.date(2024, 6, 26)),
+            (Task.MONTHLY, 1, datetime.date(2020, 1, 15), datetime.date(2024, 6, 15)),
+            (Task.MONTHLY, 1, datetime.date(2020, 1, 14), datetime.date(2024, 7, 14)),
+            (Task.MONTHLY, 1, datetime.date(2024, 8, 1), datetime.date(2024, 9, 1)),
+            (Task.YEARLY, 1, datetime.date(2016, 2, 29), datetime.date(2025, 2, 28)),
+        ]:
+            self.assertEqual(self._task(mode, period, start_date).create_recurring_child(self.today).start_date, expected)
+
+    def test_upcoming_occurrences_are_created_in_bulk(self):
+        daily = self._task(Task.DAILY, 1, self.today)
+        weekly = self._task(Task.WEEKLY, 1, self.today - datetime.timedelta(days=10))
+        self._task(Task.DAILY, 1, self.today + datetime.timedelta(days=2), recurring_parent=daily)
+        self._task(Task.ONCE, 1, self.today)
+        until = self.today + datetime.timedelta(days=14)
+        tasks = list(Task.objects.all())
+        with self.assertNumQueries(2):
+            created = Task.create_upcoming_occurrences(tasks, until, self.today)
+        self.assertEqual(len(created), 12 + 2)
+        self.assertEqual(Task.objects.filter(recurring_parent=daily).count(), 13)
+        self.assertEqual(
+            list(Task.objects.filter(recurring_parent=weekly).order_by("start_date").values_list("start_date", flat=True)),
+            [datetime.date(2024, 6, 19), datetime.date(2024, 6, 26)])
+        self.assertEqual(Task.create_upcoming_occurrences(Task.objects.all(), until, self.today), [])
+        self.assertIsNone(daily.create_recurring_child(self.today + datetime.timedelta(days=3)))
+
+
+class ObjectiveHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("user", password="password")
+        Settings.objects.create(user=cls.user)
+        cls.now = timezone.now()
+        for i in range(5):
+            objective = Objective.objects.create(user=cls.user, name=f"Objective {i}")
+            ObjectiveCompletion.objects.bulk_create([
+                ObjectiveCompletion(objective=objective, ts=int((cls.now - datetime.timedelta(days=days)).timestamp()))
+                for days in range(1000)
+            ])
+        cls.objective = objective
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_payload_is_bounded(self):
+        response = self.client.get(reverse("orgapy:objectives"), {"format": "json"})
+        objectives = response.json()["objectives"]
+        self.assertEqual(len(objectives), 5)
+        year_start = objectives_module.get_year_start(self.now).timestamp()
+        for objective in objectives:
+            self.assertTrue(all(ts >= year_start for ts in objective["history"]))
+            self.assertLessEqual(len(objective["slots"]), 366)
+            self.assertEqual(objective["status"], objectives_module.SLOT_STATE_COMPLETE)
+            self.assertEqual(objective["streak"], 1000)
+
+    def test_evaluations_are_cached(self):
+        with self.assertNumQueries(8): # including the full history, as streaks outlast the window
+            self.client.get(reverse("orgapy:objectives"), {"format": "json"})
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("orgapy:objectives"), {"format": "json"})
+        self.assertEqual(response.json()["objectives"][-1]["status"], objectives_module.SLOT_STATE_COMPLETE)
+        self.objective.objectivecompletion_set.filter(ts__gt=(self.now - datetime.timedelta(days=3)).timestamp()).delete()
+        url = reverse("orgapy:objective", args=[self.objective.id])
+        self.client.post(url, {"action": "add-completion", "ts": int(self.now.timestamp()) - 5 * 86400})
+        data = self.client.get(url, {"format": "json"}).json()
+        self.assertEqual(data["status"], objectives_module.SLOT_STATE_BUTTON)
+        self.assertEqual(data["streak"], 0)
+
+    def test_add_and_delete_completions(self):
+        url = reverse("orgapy:objective", args=[self.objective.id])
+        ts = int(self.now.timestamp()) + 60
+        self.client.post(url, {"action": "add-completion", "ts": ts})
+        self.client.post(url, {"action": "add-completion", "ts": ts})
+        self.assertEqual(self.objective.objectivecompletion_set.filter(ts=ts).count(), 2)
+        self.client.post(url, {"action": "delete-completion", "ts": ts})
+        self.assertEqual(self.objective.objectivecompletion_set.filter(ts=ts).count(), 1)
+        self.assertEqual(self.client.post(url, {"action": "delete-completion", "ts": ts + 1}).status_code, 400)
+
+    def test_evaluate(self):
+        now = timezone.make_aware(datetime.datetime(2024, 6, 15, 12))
+        def ts(day: int, hour: int = 12) -> int:
+            return int(timezone.make_aware(datetime.datetime(2024, 6, day, hour)).timestamp())
+        daily = objectives_module.evaluate([ts(d) for d in [10, 12, 13, 14]], None, 1, False, 4, now)
+        self.assertEqual((daily["status"], daily["streak"], daily["due"]), (objectives_module.SLOT_STATE_BUTTON, 3, ts(16, 4)))
+        late = objectives_module.evaluate([ts(d) for d in [12, 13, 14]] + [ts(16, 2)], None, 1, False, 4, now)
+        self.assertEqual((late["status"], late["streak"]), (objectives_module.SLOT_STATE_COMPLETE, 4))
+        partial = objectives_module.evaluate([ts(d) for d in [12, 13, 14]], ts(1), 1, False, 4, now, partial=True)
+        self.assertIsNone(partial["streak"])
+        weekly = objectives_module.evaluate([ts(3), ts(11)], ts(1), 7, False, 0, now)
+        self.assertEqual([slot[0] for slot in weekly["slots"][:2]], [ts(1, 0), ts(8, 0)])
+        self.assertEqual((weekly["status"], weekly["streak"], weekly["due"]), (objectives_module.SLOT_STATE_BUTTON, 2, ts(22, 0)))
+        flexible = objectives_module.evaluate([ts(3), ts(10)], None, 7, True, 0, now)
+        self.assertEqual((flexible["status"], flexible["streak"], flexible["due"]), (objectives_module.SLOT_STATE_BUTTON, 2, ts(16, 0)))
+
+
+class CalendarIncrementalSyncTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            import radicale.config
+            import radicale.server
+        except ImportError:
+            raise unittest.SkipTest("radicale is not installed")
+        super().setUpClass()
+        logging.getLogger("radicale").setLevel(logging.ERROR)
+        with socket.socket() as sock:
+            sock.bind(("localhost", 0))
+            port = sock.getsockname()[1]
+        folder = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(folder.cleanup)
+        configuration = radicale.config.load()
+        configuration.update({
+            "server": {"hosts": f"localhost:{port}"},
+            "storage": {"filesystem_folder": folder.name},
+            "auth": {"type": "none"},
+        }, "test", privileged=True)
+        shutdown, shutdown_out = socket.socketpair()
+        thread = threading.Thread(target=radicale.server.serve, args=(configuration, shutdown_out), daemon=True)
+        thread.start()
+        cls.addClassCleanup(thread.join, 5)
+        cls.addClassCleanup(shutdown.close)
+        for _ in range(100):
+            try:
+                socket.create_connection(("localhost", port)).close()
+                break
+            except OSError:
+                time.sleep(.05)
+        cls.url = f"http://localhost:{port}/user1/"
+        urllib.request.urlopen(urllib.request.Request(cls.url, method="MKCOL"))
+
+    def setUp(self):
+        self.user = User.objects.create_superuser("user", password="password")
+        Settings.objects.create(user=self.user)
+        name = f"calendar-{self.id().rsplit(".", 1)[-1]}"
+        with caldav.DAVClient(url=self.url, username="user1", password="") as client:
+            self.remote = client.principal().make_calendar(name=name)
+        self.calendar = Calendar.objects.create(user=self.user, url=self.url, username="user1", password="", calendar_name=name)
+
+    def _add_event(self, uid: str, title: str, days: int):
+        start = timezone.localtime().replace(hour=10, minute=0, second=0, microsecond=0) + datetime.timedelta(days=days)
+        self.remote.save_event(dtstart=start, dtend=start + datetime.timedelta(hours=1), uid=uid, summary=title)
+
+    def _fetch(self) -> tuple[list[str], int]:
+        with mock.patch.object(caldav.Calendar, "search", autospec=True, side_effect=caldav.Calendar.search) as search:
+            self.calendar.fetch_events()
+        return sorted(CalendarEvent.objects.filter(calendar=self.calendar).values_list("title", flat=True)), search.call_count
+
+    def test_incremental_sync(self):
+        self._add_event("a", "First", 1)
+        self.assertEqual(self._fetch(), (["First"], 1))
+        self.assertIsNotNone(self.calendar.calendar_url)
+        self.assertEqual(self._fetch(), (["First"], 0))
+        self._add_event("b", "Second", 2)
+        self.remote.event_by_uid("a").delete()
+        self.assertEqual(self._fetch(), (["Second"], 0))
+
+    def test_clients_are_pooled(self):
+        client_pool.clear()
+        with mock.patch("orgapy.clients.caldav.DAVClient", wraps=caldav.DAVClient) as client_class:
+            self._fetch()
+            self._fetch()
+        self.assertEqual(client_class.call_count, 1)
+        with mock.patch.object(client_pool, "idle_timeout", 0), mock.patch.object(caldav.DAVClient, "close") as close:
+            time.sleep(.01)
+            with client_pool.client(self.url, "user2", ""):
+                pass
+        close.assert_called_once()
@@ -1,6 +1,12 @@
 import datetime
+import difflib
 import random
+import re
 import time
+from collections import Counter
+
+
+CHECKLIST_ITEM_PATTERN = re.compile(r"^\[([ x])\] ?(.*)$", re.MULTILINE)
 
 
 def generate_nonce() -> str:
@@ -33,3 +39,74 @@ def date_timestamp(dt: datetime.datetime | datetime.date) -> int:
     if isinstance(dt, datetime.datetime):
         return int(1000 * dt.timestamp())
     return int(1000 * time.mktime(dt.timetuple()))
+
+
+def apply_line_patch(text: str, operations: list[dict]) -> str:
+    """Apply a list of line-range operations to a text.
+
+    Each operation is a dict with keys `start`, `end` and `lines`, and
+    replaces lines `start` (inclusive) to `end` (exclusive) with `lines`.
+    Operations are applied in order, each against the result of the previous
+    one. Raise `ValueError` if an operation is malformed or out of bounds.
+    """
+    if not isinstance(operations, list):
+        raise ValueError("Patch must be a list of operations")
+    lines = text.split("\n")
+    for operation in operations:
+        try:
+            start, end, new_lines = operation["start"], operation["end"], operation["lines"]
+        except (KeyError, TypeError):
+            raise ValueError("Malformed operation")
+        if not (isinstance(start, int) and isinstance(end, int) and 0 <= start <= end <= len(lines)):
+            raise ValueError("Operation out of bounds")
+        if not (isinstance(new_lines, list) and all(isinstance(line, str) for line in new_lines)):
+            raise ValueError("Malformed operation")
+        lines[start:end] = new_lines
+    return "\n".join(lines)
+
+
+def _get_checked_item(line: str) -> str | None:
+    match = CHECKLIST_ITEM_PATTERN.match(line)
+    return None if match is None or match.group(1) != "x" else match.group(2)
+
+
+def get_newly_checked_items(before: str, after: str) -> list[str]:
+    """Return the items checked in `after` that were not checked in `before`.
+
+    Only the regions that differ between both versions are scanned. An item
+    that was already checked and whose line was edited in place, or that was
+    moved elsewhere in the list, does not count as newly checked.
+    """
+    lines_before = before.split("\n")
+    lines_after = after.split("\n")
+    prefix = 0
+    while prefix < min(len(lines_before), len(lines_after)) and lines_before[prefix] == lines_after[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(len(lines_before), len(lines_after)) - prefix and lines_before[-suffix - 1] == lines_after[-suffix - 1]:
+        suffix += 1
+    lines_before = lines_before[prefix:len(lines_before) - suffix]
+    lines_after = lines_after[prefix:len(lines_after) - suffix]
+    removed = Counter()
+    candidates = []
+    matcher = difflib.SequenceMatcher(None, lines_before, lines_after, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        for k, line in enumerate(lines_before[i1:i2]):
+            item = _get_checked_item(line)
+            renamed = tag == "replace" and k < j2 - j1 and _get_checked_item(lines_after[j1 + k]) is not None
+            if item is not None and not renamed:
+                removed[item] += 1
+        for k, line in enumerate(lines_after[j1:j2]):
+            item = _get_checked_item(line)
+            renamed = tag == "replace" and k < i2 - i1 and _get_checked_item(lines_before[i1 + k]) is not None
+            if item is not None and not renamed:
+                candidates.append(item)
+    checked = []
+    for item in candidates:
+        if removed[item] > 0:
+            removed[item] -= 1
+        else:
+            checked.append(item)
+    return checked
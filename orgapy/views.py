@@ -1,32 +1,54 @@
 import datetime
+import itertools
 import json
 import re
 import time
-from typing import Callable, Literal, TypeVar, Any
+from typing import Callable, Iterable, Iterator, Literal, TypeVar, Any
 from urllib.parse import urlencode
 
 from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.models import AbstractBaseUser, AnonymousUser
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied, BadRequest
 from django.core.paginator import Page, Paginator
-from django.db import models, connection
-from django.db.models import Q, QuerySet, Min, Max
-from django.http import HttpRequest, HttpResponse, Http404, JsonResponse
+from django.db import models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, QuerySet, Min, Max, Value
+from django.db.models.functions import Coalesce
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpRequest, HttpResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
 from django.utils import timezone
 from django.utils.text import slugify
 from django.views.decorators.http import condition
 
 from .models import *
-from .utils import date_timestamp
+from .objectives import evaluate_objectives, invalidate_objective
+from .pagination import CursorPage, CursorPaginator
+from .rendering import get_embedded_notes, render_note
+from .search import format_snippet, search_documents
+from .suggestions import get_title_key, suggestion_cache
+from .sync import schedule_sync, sync_calendars
+from .utils import apply_line_patch, date_timestamp, get_newly_checked_items
 
 
 UserObject = TypeVar("UserObject", Tag, Document, ProgressLog, Project, MoodLog, Task, Objective, Calendar)
 LogT = TypeVar("LogT", ProgressLog, MoodLog)
 LoggedUser = AbstractBaseUser
 
+EXPORT_CHUNK_SIZE = 2000
+SNIPPET_CACHE_TIMEOUT = 300
+REFERENCE_PATTERN = re.compile(r"@(?:embed)?(note|sheet|map)/([a-zA-Z0-9]+)")
 
-def _pretty_paginator(page: Page, show_around: int = 2, **attrs) -> dict:
+
+def _pretty_paginator(page: Page | CursorPage, show_around: int = 2, **attrs) -> dict:
+    if isinstance(page, CursorPage):
+        return {
+            "cursor": True,
+            "prev": page.previous_cursor,
+            "next": page.next_cursor,
+            "pages": list(),
+            "count": page.paginator.count,
+        }
     to_show = sorted({
         1,
         *[
@@ -58,6 +80,26 @@ def _pretty_paginator(page: Page, show_around: int = 2, **attrs) -> dict:
     return paginator
 
 
+def _stream_json_entries(data: dict, entries: Iterable[dict]) -> StreamingHttpResponse:
+    def generate() -> Iterator[str]:
+        head = json.dumps(data, cls=DjangoJSONEncoder)[:-1]
+        yield head + (", " if data else "") + '"entries": ['
+        for i, entry in enumerate(entries):
+            yield ("," if i > 0 else "") + json.dumps(entry, cls=DjangoJSONEncoder)
+        yield "]}"
+    return StreamingHttpResponse(generate(), content_type="application/json")
+
+
+def _stream_tsv_lines(header: str, lines: Iterable[str], filename: str) -> StreamingHttpResponse:
+    def generate() -> Iterator[str]:
+        yield header
+        for line in lines:
+            yield "\n" + line
+    response = StreamingHttpResponse(generate(), content_type="text/tab-separated-values; charset=utf-8")
+    response["Content-Disposition"] = f'inline; filename="{filename}"'
+    return response
+
+
 def _find_user_object(
         model: type[UserObject],
         key: str | list[str],
@@ -90,23 +132,19 @@ def _find_user_object(
     return obj
 
 
-def _get_checked_items(checklist: str) -> list[str]:
-    return re.findall(r"\[x\] (.*)", checklist)
-
-
 def _compare_checklists(user: LoggedUser | AnonymousUser, reference: str, before: str | None, after: str | None):
     if isinstance(user, AnonymousUser):
         raise PermissionDenied()
     if before is None or after is None:
         return
-    checked_before = set(_get_checked_items(before))
-    checked_after = set(_get_checked_items(after))
-    for item in checked_after.difference(checked_before):
-        ProgressLog.objects.create(
+    ProgressLog.objects.bulk_create([
+        ProgressLog(
             user=user,
             type=ProgressLog.PROJECT_CHECKLIST_ITEM_CHECKED,
             description=f"{reference} - {item}"
         )
+        for item in dict.fromkeys(get_newly_checked_items(before, after))
+    ])
 
 
 def _get_or_create_settings(user: LoggedUser | AnonymousUser) -> Settings:
@@ -118,59 +156,73 @@ def _get_or_create_settings(user: LoggedUser | AnonymousUser) -> Settings:
     return Settings.objects.create(user=user)
 
 
-def _build_fts_query(user_input: str) -> str:
-    phrases = re.findall(r'"([^"]+)"', user_input)
-    remaining = re.sub(r'"[^"]+"', '', user_input)
-    words = re.findall(r'\w+', remaining)
-    parts = []
-    parts.extend(f'"{p}"' for p in phrases)
-    parts.extend(f'{w}*' for w in words)
-    return ' '.join(parts)
-
-
-def _search_within_queryset(
-        qs: QuerySet[Document],
-        query: str,
-        limit: int = 500,
-        title_weight: float = 10,
-        content_weight: float = 1,
-    ) -> QuerySet[Document]:
-
-    if not query:
-        return qs
-
-    fts_query = _build_fts_query(query)
-
-    subquery = qs.values("id")
-    base_sql, base_params = subquery.query.sql_with_params()
-
-    sql = f"""
-        SELECT d.id, bm25(orgapy_document_fts, {title_weight}, {content_weight}) AS rank
-        FROM orgapy_document_fts
-        JOIN orgapy_document d ON d.id = orgapy_document_fts.rowid
-        WHERE orgapy_document_fts MATCH %s
-        AND d.id IN (
-            {base_sql}
-        )
-        ORDER BY rank
-        LIMIT {limit}
-    """
-
-    with connection.cursor() as cursor:
-        cursor.execute(sql, [fts_query, *base_params])
-        rows = cursor.fetchall()
-
-    if not rows:
-        return qs.none()
-
-    ids = [row[0] for row in rows]
-
-    ordering = models.Case(*[
-        models.When(pk=pk, then=pos)
-        for pos, pk in enumerate(ids)
-    ])
-
-    return qs.filter(pk__in=ids).annotate(relevance=ordering).order_by("relevance")
+def _get_tags_with_counts(
+        user: LoggedUser | AnonymousUser,
+        exclude_deleted: bool = False,
+        exclude_hidden: bool = False,
+        ) -> QuerySet[Tag]:
+    """Annotate each tag of the user with the number of documents it is
+    attached to, as `document_count`, in a single aggregated query."""
+    document_filter = Q()
+    if exclude_deleted:
+        document_filter &= Q(documents__deleted=False)
+    if exclude_hidden:
+        document_filter &= Q(documents__hidden=False)
+    return Tag.objects\
+        .filter(user=user)\
+        .annotate(document_count=Count("documents", filter=document_filter))
+
+
+def _sync_document_m2m(doc: Document, field_name: str, target_ids: Iterable[int]):
+    """Replace the targets of a many-to-many field of a document with one
+    DELETE and one INSERT on the through table, without reading it first."""
+    field = Document._meta.get_field(field_name)
+    through = field.remote_field.through # type: ignore
+    source = field.m2m_field_name() # type: ignore
+    target = field.m2m_reverse_field_name() # type: ignore
+    target_ids = set(target_ids)
+    through.objects\
+        .filter(**{source: doc})\
+        .exclude(**{f"{target}_id__in": target_ids})\
+        .delete()
+    if target_ids:
+        through.objects.bulk_create(
+            [through(**{f"{source}_id": doc.id, f"{target}_id": target_id}) for target_id in target_ids],
+            ignore_conflicts=True)
+
+
+def _resolve_tags(user: LoggedUser | AnonymousUser, names: Iterable[str]) -> list[Tag]:
+    """Fetch tags by name, creating the missing ones in bulk."""
+    names = set(names)
+    if not names:
+        return []
+    tags = list(Tag.objects.filter(user=user, name__in=names))
+    missing = names.difference(tag.name for tag in tags)
+    if missing:
+        Tag.objects.bulk_create([Tag(user=user, name=name) for name in missing], ignore_conflicts=True)
+        suggestion_cache.invalidate(user.id)
+        tags += list(Tag.objects.filter(user=user, name__in=missing))
+    return tags
+
+
+def _sync_document_tags(doc: Document, names: Iterable[str]):
+    clean_names = set()
+    for dirty_name in names:
+        name = dirty_name.lower().strip()
+        if name == "" or name == "uncategorized":
+            continue
+        clean_names.add(name)
+    _sync_document_m2m(doc, "tags", [tag.id for tag in _resolve_tags(doc.user, clean_names)])
+
+
+def _sync_document_references(doc: Document, content: str):
+    nonces = set(nonce for _, nonce in REFERENCE_PATTERN.findall(content))
+    target_ids = []
+    if nonces:
+        target_ids = Document.objects\
+            .filter(user=doc.user, nonce__in=nonces)\
+            .values_list("id", flat=True)
+    _sync_document_m2m(doc, "references", target_ids)
 
 
 def _render_document_list(
@@ -184,6 +236,7 @@ def _render_document_list(
         dt_end: datetime.date | None = None,
         sort_key: Literal["creation", "modification", "access", "deletion", "title", "relevance"] | None = None,
         page_size: int | None = None,
+        pagination: Literal["page", "cursor"] | None = None,
         kwargs: dict[str, Any] = {},
     ) -> HttpResponse:
     """
@@ -211,6 +264,12 @@ def _render_document_list(
             If None, uses GET params.
             Pinned documents will always appear first.
         page_size: Number of documents per page.
+        pagination: Pagination mode.
+            If None, uses GET params.
+            If 'page', pages are addressed by number and the exact count is computed.
+            If 'cursor', pages are addressed by opaque cursors (keyset pagination),
+            so that deep pages cost as much as the first one. The total count is
+            then cached and only approximate.
         kwargs: Any arguments to be passed to the template.
     """
 
@@ -272,6 +331,12 @@ def _render_document_list(
     if sort_key:
         attrs["sort"] = sort_key
 
+    if pagination is None:
+        s = request.GET.get("pagination")
+        pagination = s if s in ["page", "cursor"] else None # type: ignore
+    if pagination == "cursor":
+        attrs["pagination"] = pagination
+
     qs = Document.objects.filter(user=request.user)
     if type_filter is not None:
         qs = qs.filter(type=type_filter)
@@ -300,39 +365,43 @@ def _render_document_list(
         qs = qs.filter(date_creation__lt=dt_end)
 
     if search_query:
-        qs = _search_within_queryset(qs, search_query)
-
-    if sort_key:
-        if sort_key == "relevance":
-            pass
-        elif sort_key == "title":
-            qs = qs.order_by("-pinned", "title")
-        else:
-            qs = qs.order_by("-pinned", f"-date_{sort_key}")
+        qs = search_documents(qs, search_query)
+
+    if sort_key == "relevance" and search_query:
+        ordering = ["relevance", "id"]
+    elif sort_key == "title":
+        qs = qs.annotate(sort_title=Coalesce("title", Value("")))
+        ordering = ["-pinned", "sort_title", "id"]
+    elif sort_key == "deletion":
+        qs = qs.annotate(sort_deletion=Coalesce("date_deletion", Value(datetime.datetime.min.replace(tzinfo=datetime.timezone.utc), output_field=models.DateTimeField())))
+        ordering = ["-pinned", "-sort_deletion", "-id"]
+    elif sort_key and sort_key != "relevance":
+        ordering = ["-pinned", f"-date_{sort_key}", "-id"]
     else:
-        qs = qs.order_by("-pinned", "-date_modification")
-        
+        ordering = ["-pinned", "-date_modification", "-id"]
+    qs = qs.order_by(*ordering)
+
     if request.GET.get("format") == "json":
-        mindt = Document.objects.values("date_creation").aggregate(Min("date_creation"))["date_creation__min"]
-        maxdt = Document.objects.values("date_creation").aggregate(Max("date_creation"))["date_creation__max"]
-        data = {
-            "entries": [],
-            "mindt": date_timestamp(mindt),
-            "maxdt": date_timestamp(maxdt),
-        }
-        for doc in qs:
-            data["entries"].append({
-                "dt": date_timestamp(doc.date_creation),
-                "label": doc.title,
-                "icon": doc.type_icon,
-                "href": doc.get_absolute_url()
-            })
-        return JsonResponse(data)
+        bounds = Document.objects.aggregate(mindt=Min("date_creation"), maxdt=Max("date_creation"))
+        docs = qs.only("nonce", "type", "title", "date_creation").iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return _stream_json_entries(
+            {
+                "mindt": date_timestamp(bounds["mindt"]),
+                "maxdt": date_timestamp(bounds["maxdt"]),
+            },
+            (
+                {
+                    "dt": date_timestamp(doc.date_creation),
+                    "label": doc.title,
+                    "icon": doc.type_icon,
+                    "href": doc.get_absolute_url()
+                }
+                for doc in docs
+            ))
 
     if request.GET.get("format") == "tsv":
-        lines = ["id\tnonce\ttype\ttitle\tdate_creation\tdate_modification\tdate_access\tdate_deletion\tpublic\tpinned\thidden\tdeleted\ttags"]
-        for doc in qs:
-            lines.append("\t".join([
+        def tsv_generator(doc: Document) -> str:
+            return "\t".join([
                 str(doc.id),
                 doc.nonce,
                 doc.type,
@@ -346,14 +415,28 @@ def _render_document_list(
                 str(doc.hidden),
                 str(doc.deleted),
                 ";".join([tag.name for tag in doc.tags.all()])
-            ]))
-        response = HttpResponse("\n".join(lines), content_type="text/tab-separated-values; charset=utf-8")
-        response["Content-Disposition"] = f'inline; filename="documents.tsv"'
-        return response
-
-    paginator = Paginator(qs, page_size)
-    page = request.GET.get("page")
-    objects = paginator.get_page(page)
+            ])
+        docs = qs.defer("content", "config").prefetch_related("tags").iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return _stream_tsv_lines(
+            "id\tnonce\ttype\ttitle\tdate_creation\tdate_modification\tdate_access\tdate_deletion\tpublic\tpinned\thidden\tdeleted\ttags",
+            map(tsv_generator, docs),
+            "documents.tsv")
+
+    qs = qs\
+        .defer("content", "config")\
+        .prefetch_related("tags")\
+        .annotate(has_ongoing_projects=Exists(
+            Project.objects.filter(document=OuterRef("pk")).exclude(status=Project.ARCHIVED)))
+
+    if pagination == "cursor":
+        objects = CursorPaginator(qs, ordering, page_size).get_page(request.GET.get("cursor"))
+    else:
+        paginator = Paginator(qs, page_size)
+        page = request.GET.get("page")
+        objects = paginator.get_page(page)
+    if search_query:
+        for obj in objects:
+            obj.snippet = format_snippet(obj.snippet or "")
     return render(request, template_name, {
         "active": "documents",
         "objects": objects,
@@ -412,24 +495,19 @@ def _render_calendar(
     logs = model.objects.filter(user=request.user, **{f"{date_field}__range": [dt_start, dt_end + datetime.timedelta(days=1)]})
 
     if request.GET.get("format") == "json":
-        mindt = model.objects.values(date_field).aggregate(Min(date_field))[f"{date_field}__min"]
-        maxdt = model.objects.values(date_field).aggregate(Max(date_field))[f"{date_field}__max"]
-        data = {
-            "entries": [],
-            "mindt": date_timestamp(mindt),
-            "maxdt": date_timestamp(maxdt),
-        }
-        for log in logs:
-            data["entries"].append(json_generator(log))
-        return JsonResponse(data)
+        bounds = model.objects.aggregate(mindt=Min(date_field), maxdt=Max(date_field))
+        return _stream_json_entries(
+            {
+                "mindt": date_timestamp(bounds["mindt"]),
+                "maxdt": date_timestamp(bounds["maxdt"]),
+            },
+            map(json_generator, logs.iterator(chunk_size=EXPORT_CHUNK_SIZE)))
 
     elif request.GET.get("format") == "tsv":
-        lines = [tsv_header]
-        for log in logs:
-            lines.append(tsv_generator(log))
-        response = HttpResponse("\n".join(lines), content_type="text/tab-separated-values; charset=utf-8")
-        response["Content-Disposition"] = f'inline; filename="{filename}-{dt_start.date()}-{dt_end.date()}.tsv"'
-        return response
+        return _stream_tsv_lines(
+            tsv_header,
+            map(tsv_generator, logs.iterator(chunk_size=EXPORT_CHUNK_SIZE)),
+            f"{filename}-{dt_start.date()}-{dt_end.date()}.tsv")
 
     return render(request, template, {**kwargs})
 
@@ -452,41 +530,31 @@ def view_home(request: HttpRequest) -> HttpResponse:
 
     now = timezone.now()
 
-    events = []
-    for calendar in Calendar.objects.filter(user=request.user):
-        events += calendar.get_events()
+    schedule_sync(Calendar.objects.filter(user=request.user))
+    this_morning = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    events = CalendarEvent.objects\
+        .filter(calendar__user=request.user, dtend__gt=this_morning, dtstart__lt=this_morning + datetime.timedelta(days=settings.calendar_lookahead))\
+        .order_by("dtstart", "title")
     event_groups_dict = {}
     for event in events:
-        dtstart = datetime.datetime.fromisoformat(event["dtstart"])
-        dtend = datetime.datetime.fromisoformat(event["dtend"])
-        if dtend.tzinfo is None:
-            dtend = dtend.replace(tzinfo=now.tzinfo)
-        date = dtstart.date()
-        event_groups_dict.setdefault(date, [])
-        event_groups_dict[date].append({
-            "title": event["title"],
-            "time": None if len(event["dtstart"]) < 11 else dtstart.time(),
-            "location": event["location"],
-            "over": now > dtend
+        dtstart = timezone.localtime(event.dtstart)
+        event_groups_dict.setdefault(dtstart.date(), []).append({
+            "title": event.title,
+            "time": None if event.all_day else dtstart.time(),
+            "location": event.location,
+            "over": now > event.dtend
         })
-    event_groups = sorted(event_groups_dict.items())
-    for i in range(len(event_groups)):
-        event_groups[i][1].sort(key=lambda x: (x.get("time"), x.get("title")))
+    event_groups = list(event_groups_dict.items())
 
     tasks = Task.objects\
         .filter(user=request.user, completed=False, start_date__lte=now)\
-        .order_by("due_date", "start_date")
-    today = now.date()
-    task_groups_dict = {}
-    for task in tasks:
-        group = task.get_group(today)
-        task_groups_dict.setdefault(group, [])
-        task_groups_dict[group].append(task)
+        .annotate(group=Task.get_group_expression(now.date()))\
+        .order_by("group", "due_date", "start_date")
     task_groups = []
-    for group_index, group_tasks in sorted(task_groups_dict.items()):
+    for group_index, group_tasks in itertools.groupby(tasks, key=lambda task: task.group):
         task_groups.append({
             "label": Task.GROUP_LABELS[group_index],
-            "tasks": group_tasks,
+            "tasks": list(group_tasks),
             "open": group_index <= Task.THISWEEK
         })
     
@@ -498,7 +566,7 @@ def view_home(request: HttpRequest) -> HttpResponse:
         "projects": active_projects,
         "event_groups": event_groups,
         "task_groups": task_groups,
-        "objectives": [o.to_dict() for o in objectives],
+        "objectives": evaluate_objectives(objectives, settings.objective_start_hours, now),
         "active": "home",
     })
 
@@ -537,6 +605,11 @@ def view_projects(request: HttpRequest) -> HttpResponse:
     if status_filter:
         attrs["status"] = status_filter
 
+    s = request.GET.get("progress")
+    progress_filter = s if s in ["empty", "ongoing", "done"] else None
+    if progress_filter:
+        attrs["progress"] = progress_filter
+
     document_filter = request.GET.get("document")
     if document_filter:
         attrs["document"] = document_filter
@@ -554,13 +627,19 @@ def view_projects(request: HttpRequest) -> HttpResponse:
         attrs["end"] = dt_end.strftime("%Y-%m-%d")
 
     s = request.GET.get("sort")
-    sort_key = s if s in ["creation", "modification", "archived"] else None
+    sort_key = s if s in ["creation", "modification", "archived", "progress"] else None
     if sort_key:
         attrs["sort"] = sort_key
 
     qs = Project.objects.filter(user=request.user)
     if status_filter:
         qs = qs.filter(status=status_filter)
+    if progress_filter == "empty":
+        qs = qs.filter(items_count=0)
+    elif progress_filter == "ongoing":
+        qs = qs.filter(completed_items_count__lt=F("items_count"))
+    elif progress_filter == "done":
+        qs = qs.filter(items_count__gt=0, completed_items_count=F("items_count"))
     if document_filter:
         qs = qs.filter(document__nonce=document_filter)
     if dt_start and dt_end:
@@ -572,32 +651,37 @@ def view_projects(request: HttpRequest) -> HttpResponse:
     if search_query:
         qs = qs.filter(Q(title__icontains=search_query) | Q(checklist__icontains=search_query))
 
-    if sort_key:
+    if sort_key == "progress":
+        qs = qs.order_by(Project.get_progress_expression().desc(nulls_last=True), "-date_modification")
+    elif sort_key:
         qs = qs.order_by(f"-date_{sort_key}")
     else:
         qs = qs.order_by("-date_modification")
 
     if request.GET.get("format") == "json":
-        mindt = Project.objects.values("date_creation").aggregate(Min("date_creation"))["date_creation__min"]
-        maxdt = Project.objects.values("date_creation").aggregate(Max("date_creation"))["date_creation__max"]
-        data = {
-            "entries": [],
-            "mindt": date_timestamp(mindt),
-            "maxdt": date_timestamp(maxdt),
-        }
-        for project in qs:
-            data["entries"].append({
-                "dt": date_timestamp(project.date_creation),
-                "label": project.reference,
-                "icon": "ri-briefcase-line",
-                "href": project.get_absolute_url()
-            })
-        return JsonResponse(data)
+        bounds = Project.objects.aggregate(mindt=Min("date_creation"), maxdt=Max("date_creation"))
+        projects = qs\
+            .select_related("document")\
+            .only("id", "title", "date_creation", "document", "document__nonce", "document__title")\
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return _stream_json_entries(
+            {
+                "mindt": date_timestamp(bounds["mindt"]),
+                "maxdt": date_timestamp(bounds["maxdt"]),
+            },
+            (
+                {
+                    "dt": date_timestamp(project.date_creation),
+                    "label": project.reference,
+                    "icon": "ri-briefcase-line",
+                    "href": project.get_absolute_url()
+                }
+                for project in projects
+            ))
 
     if request.GET.get("format") == "tsv":
-        lines = ["id\ttitle\tdocument_nonce\tdocument_title\tdate_creation\tdate_modification\tdate_archived\tstatus"]
-        for project in qs:
-            lines.append("\t".join([
+        def tsv_generator(project: Project) -> str:
+            return "\t".join([
                 str(project.id),
                 project.title if project.title else "",
                 project.document.nonce if project.document else "",
@@ -606,10 +690,15 @@ def view_projects(request: HttpRequest) -> HttpResponse:
                 project.date_modification.isoformat(),
                 project.date_archived.isoformat() if project.date_archived else "",
                 project.get_status_display(), # type: ignore
-            ]))
-        response = HttpResponse("\n".join(lines), content_type="text/tab-separated-values; charset=utf-8")
-        response["Content-Disposition"] = f'inline; filename="documents.tsv"'
-        return response
+            ])
+        projects = qs\
+            .select_related("document")\
+            .defer("checklist", "document__content", "document__config")\
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return _stream_tsv_lines(
+            "id\ttitle\tdocument_nonce\tdocument_title\tdate_creation\tdate_modification\tdate_archived\tstatus",
+            map(tsv_generator, projects),
+            "documents.tsv")
 
     paginator = Paginator(qs, page_size)
     page = request.GET.get("page")
@@ -624,26 +713,49 @@ def view_projects(request: HttpRequest) -> HttpResponse:
     })
 
 
-def _project_etag_func(request: HttpRequest, project_id: str) -> str | None:
+def _get_conditional_object(request: HttpRequest, model: type[Document] | type[Project], fields: list[str], **lookup) -> Document | Project | None:
+    """Fetch the fields that the ETag and Last-Modified headers of an object
+    depend on, once per request, so that both condition functions share a
+    single small query. The view loads the other fields with
+    `_load_deferred_fields` only if it does not answer 304."""
+    cache = request.__dict__.setdefault("_orgapy_objects", {})
+    key = (model, tuple(sorted(lookup.items())))
+    if key not in cache:
+        cache[key] = model.objects.only(*fields).filter(**lookup).first()
+    return cache[key]
+
+
+def _load_deferred_fields(obj: Document | Project) -> Document | Project:
+    deferred = obj.get_deferred_fields()
+    if deferred:
+        obj.refresh_from_db(fields=deferred)
+    return obj
+
+
+def _get_project(request: HttpRequest, project_id: str) -> Project | None:
     try:
-        project = Project.objects.get(user=request.user, id=project_id)
-    except Project.DoesNotExist:
+        return _get_conditional_object(request, Project, ["updated_at"], user=request.user, id=int(project_id)) # type: ignore
+    except (ValueError, TypeError):
         return None
-    return project.etag
+
+
+def _project_etag_func(request: HttpRequest, project_id: str) -> str | None:
+    project = _get_project(request, project_id)
+    return None if project is None else project.etag
 
 
 def _project_last_modified_func(request: HttpRequest, project_id: str) -> datetime.datetime | None:
-    try:
-        project = Project.objects.get(user=request.user, id=project_id)
-    except Project.DoesNotExist:
-        return None
-    return project.updated_at
+    project = _get_project(request, project_id)
+    return None if project is None else project.updated_at
 
 
 @permission_required("orgapy.view_project")
 @condition(_project_etag_func, _project_last_modified_func)
 def view_project(request: HttpRequest, project_id: str) -> HttpResponse:
-    project = _find_user_object(Project, "id", project_id, request.user)
+    project = _get_project(request, project_id)
+    if project is None:
+        raise Http404()
+    _load_deferred_fields(project)
 
     if request.method == "POST":
 
@@ -665,6 +777,7 @@ def view_project(request: HttpRequest, project_id: str) -> HttpResponse:
 
         if request.POST.get("delete") == "on":
             project.delete()
+            suggestion_cache.invalidate(request.user.id)
             if "next" in request.POST:
                 return redirect(request.POST["next"])
             if is_ajax:
@@ -727,6 +840,31 @@ def view_project(request: HttpRequest, project_id: str) -> HttpResponse:
     })
 
 
+def _snippet_cache_key(user_id: int, nonce: str) -> str:
+    return f"orgapy:snippet:{user_id}:{nonce}"
+
+
+def _invalidate_snippets(user_id: int, nonces: list[str]):
+    cache.delete_many([_snippet_cache_key(user_id, nonce) for nonce in nonces])
+
+
+def _get_snippets(user: AbstractBaseUser | AnonymousUser, nonces: list[str]) -> dict[str, dict]:
+    keys = {_snippet_cache_key(user.pk, nonce): nonce for nonce in set(nonces)}
+    snippets = {keys[key]: snippet for key, snippet in cache.get_many(list(keys)).items()}
+    missing = [nonce for nonce in keys.values() if nonce not in snippets]
+    if missing:
+        fetched = {}
+        for doc in Document.objects.filter(user=user, nonce__in=missing).only("nonce", "title", "type"):
+            fetched[doc.nonce] = {
+                "title": doc.title,
+                "href": doc.get_absolute_url(),
+                "icon": doc.type_icon,
+            }
+        cache.set_many({_snippet_cache_key(user.pk, nonce): snippet for nonce, snippet in fetched.items()}, SNIPPET_CACHE_TIMEOUT)
+        snippets.update(fetched)
+    return snippets
+
+
 @permission_required("orgapy.view_document")
 def view_documents(request: HttpRequest) -> HttpResponse:
 
@@ -750,18 +888,14 @@ def view_documents(request: HttpRequest) -> HttpResponse:
     
     if request.GET.get("part") == "snippet":
         nonces = request.GET.getlist("nonce")
+        snippets = _get_snippets(request.user, nonces)
         results = []
         for nonce in nonces:
             result = {"nonce": nonce, "title": None, "href": None, "icon": None, "error": None}
-            try:
-                doc = Document.objects.get(user=request.user, nonce=nonce)
-                result["title"] = doc.title
-                result["href"] = doc.get_absolute_url()
-                result["icon"] = doc.type_icon
-            except Document.DoesNotExist:
+            if nonce in snippets:
+                result.update(snippets[nonce])
+            else:
                 result["error"] = "Invalid reference"
-            except Exception:
-                result["error"] = "Error"
             results.append(result)
         return JsonResponse({"results": results})
 
@@ -769,29 +903,27 @@ def view_documents(request: HttpRequest) -> HttpResponse:
     return _render_document_list(request, template_name)
 
 
+def _get_document(request: HttpRequest, nonce: str) -> Document | None:
+    return _get_conditional_object(request, Document, ["nonce", "updated_at"], nonce=nonce) # type: ignore
+
+
 def _document_etag_func(request: HttpRequest, nonce: str) -> str | None:
-    try:
-        doc = Document.objects.get(nonce=nonce)
-    except Document.DoesNotExist:
-        return None
-    return doc.etag
+    doc = _get_document(request, nonce)
+    return None if doc is None else doc.etag
 
 
 def _document_last_modified_func(request: HttpRequest, nonce: str) -> datetime.datetime | None:
-    try:
-        doc = Document.objects.get(nonce=nonce)
-    except Document.DoesNotExist:
-        return None
-    return doc.updated_at
+    doc = _get_document(request, nonce)
+    return None if doc is None else doc.updated_at
 
 
 @condition(_document_etag_func, _document_last_modified_func)
 def view_document(request: HttpRequest, nonce: str) -> HttpResponse:
 
-    try:
-        doc = Document.objects.get(nonce=nonce)
-    except Document.DoesNotExist:
+    doc = _get_document(request, nonce)
+    if doc is None:
         raise Http404()
+    _load_deferred_fields(doc)
     has_permission = False
     readonly = True
     if request.user is not None and doc.user == request.user and request.user.has_perm("orgapy.view_document"):
@@ -826,6 +958,7 @@ def view_document(request: HttpRequest, nonce: str) -> HttpResponse:
 
         if request.POST.get("destroy") == "on":
             doc.delete()
+            _invalidate_snippets(doc.user_id, [doc.nonce]) # type: ignore
             if "next" in request.POST:
                 return redirect(request.POST["next"])
             return redirect("orgapy:documents")
@@ -886,46 +1019,46 @@ def view_document(request: HttpRequest, nonce: str) -> HttpResponse:
             if doc.deleted:
                 update_fields.append("date_deletion")
                 doc.date_deletion = now
+            _invalidate_snippets(doc.user_id, [doc.nonce]) # type: ignore
 
-        if "title" in request.POST:
+        if "title" in request.POST and request.POST["title"] != doc.title:
             update_fields.append("title")
             doc.title = request.POST["title"]
+            _invalidate_snippets(doc.user_id, [doc.nonce]) # type: ignore
 
-        if "subtitle" in request.POST:
+        if "subtitle" in request.POST and request.POST["subtitle"] != doc.subtitle:
             update_fields.append("subtitle")
             doc.subtitle = request.POST["subtitle"]
 
-        if "content" in request.POST or new_content:
-            if not new_content:
-                new_content = request.POST["content"]
-            if new_content and new_content != doc.content:
-                update_fields.append("content")
-                update_fields.append("date_modification")
-                doc.content = new_content
-                doc.date_modification = now
-                pattern = re.compile(r"@(?:embed)?(note|sheet|map)/([a-zA-Z0-9]+)")
-                nonces = set([nonce for _, nonce in re.findall(pattern, new_content)])
-                doc.references.set(Document.objects.filter(user=doc.user, nonce__in=nonces))
-
-        if "config" in request.POST:
+        if "patch" in request.POST:
+            try:
+                base = (doc.content or "") if new_content is None else new_content
+                new_content = apply_line_patch(base, json.loads(request.POST["patch"]))
+            except ValueError:
+                raise BadRequest("Invalid patch")
+
+        if new_content is None and "content" in request.POST:
+            new_content = request.POST["content"]
+
+        # None means no content was submitted, while "" empties the document
+        if new_content is not None and new_content != (doc.content or ""):
+            update_fields.append("content")
+            update_fields.append("date_modification")
+            doc.content = new_content
+            doc.date_modification = now
+            _sync_document_references(doc, new_content)
+
+        if "config" in request.POST and request.POST["config"] != doc.config:
             update_fields.append("config")
             doc.config = request.POST["config"]
 
         if "tags" in request.POST:
-            doc.tags.clear()
-            name_list = request.POST.get("tags", "").split(";")
-            for dirty_name in name_list:
-                name = dirty_name.lower().strip()
-                if name == "" or name == "uncategorized":
-                    continue
-                try:
-                    tag = Tag.objects.get(name=name, user=request.user)
-                except Tag.DoesNotExist:
-                    tag = Tag.objects.create(name=name, user=request.user)
-                doc.tags.add(tag)
+            _sync_document_tags(doc, request.POST.get("tags", "").split(";"))
 
-        doc.updated_at = now
-        doc.save(update_fields=update_fields + ["updated_at"])
+        # Only touch the row (and the full-text index) if something changed
+        if update_fields or "tags" in request.POST:
+            doc.updated_at = now
+            doc.save(update_fields=update_fields + ["updated_at"])
 
         if "next" in request.POST:
             return redirect(request.POST["next"])
@@ -980,12 +1113,15 @@ tags:  {", ".join(category.name for category in doc.tags.all())}
 
     elif request.GET.get("embed"):
         template = f"orgapy/{doc.type}.html"
-        if doc.type == "note":
-            template = "orgapy/note_embed.html"
-        response = render(request, template, {
+        context = {
             "document": doc,
             "readonly": True,
-        })
+        }
+        if doc.type == "note":
+            template = "orgapy/note_embed.html"
+            context["rendered"] = render_note(doc)
+            context["embeds"] = get_embedded_notes(doc, owner_view=doc.user == request.user)
+        response = render(request, template, context)
 
     elif request.GET.get("edit"):
         if readonly:
@@ -1005,12 +1141,17 @@ tags:  {", ".join(category.name for category in doc.tags.all())}
         })
 
     else:
-        response = render(request, f"orgapy/{doc.type}.html", {
+        context = {
             "document": doc,
             "readonly": readonly,
             "active": "documents",
             "etag": doc.etag,
-        })
+        }
+        if doc.type == "note":
+            # Interactive widgets are bound to the client-side rendering
+            context["rendered"] = render_note(doc) if readonly else None
+            context["embeds"] = get_embedded_notes(doc, owner_view=not readonly)
+        response = render(request, f"orgapy/{doc.type}.html", context)
 
     response["Cache-Control"] = "no-cache; must-revalidate"
     return response
@@ -1019,10 +1160,17 @@ tags:  {", ".join(category.name for category in doc.tags.all())}
 @permission_required("orgapy.view_document")
 def view_trash(request: HttpRequest) -> HttpResponse:
     if request.method == "POST":
+        trash = Document.objects.filter(user=request.user, deleted=True)
         if request.POST.get("restore") and request.user.has_perm("orgapy.change_document"):
-            Document.objects.filter(user=request.user, deleted=True).update(deleted=False)
+            nonces = list(trash.values_list("nonce", flat=True))
+            trash.update(deleted=False)
+            suggestion_cache.invalidate(request.user.id)
+            _invalidate_snippets(request.user.id, nonces)
         if request.POST.get("destroy") and request.user.has_perm("orgapy.delete_document"):
-            Document.objects.filter(user=request.user, deleted=True).delete()
+            nonces = list(trash.values_list("nonce", flat=True))
+            trash.delete()
+            suggestion_cache.invalidate(request.user.id)
+            _invalidate_snippets(request.user.id, nonces)
         if "next" in request.POST:
             return redirect(request.POST["next"])
         return redirect("orgapy:documents")
@@ -1031,9 +1179,32 @@ def view_trash(request: HttpRequest) -> HttpResponse:
 
 @permission_required("orgapy.view_tag")
 def view_tags(request: HttpRequest) -> HttpResponse:
-    uncategorized = Document.objects.filter(user=request.user, tags__isnull=True).count()
+    exclude = set(request.GET.get("exclude", "").split(";"))
+    documents = Document.objects.filter(user=request.user, tags__isnull=True)
+    if "deleted" in exclude:
+        documents = documents.filter(deleted=False)
+    if "hidden" in exclude:
+        documents = documents.filter(hidden=False)
+    uncategorized = documents.count()
+    tags = _get_tags_with_counts(request.user, exclude_deleted="deleted" in exclude, exclude_hidden="hidden" in exclude)
+
+    if request.GET.get("format") == "json":
+        if request.GET.get("sort") == "count":
+            tags = tags.order_by("-document_count", "name")
+        return JsonResponse({
+            "tags": [
+                {
+                    "name": tag.name,
+                    "count": tag.document_count, # type: ignore
+                    "url": tag.get_absolute_url(),
+                }
+                for tag in tags
+            ],
+            "uncategorized": uncategorized,
+        })
+
     return render(request, "orgapy/tags.html", {
-        "tags": Tag.objects.filter(user=request.user),
+        "tags": tags,
         "active": "documents",
         "uncategorized": uncategorized
     })
@@ -1052,14 +1223,25 @@ def view_tag(request: HttpRequest, name: str) -> HttpResponse:
 
         if request.POST.get("delete"):
             tag.delete()
+            suggestion_cache.invalidate(request.user.id)
             return redirect("orgapy:tags")
         if "name" in request.POST:
             new_name = request.POST.get("name")
             if new_name is None:
                 raise BadRequest("Missing name")
-            if len(new_name) > 0:
-                tag.name = new_name.lower()
-                tag.save()
+            new_name = new_name.lower()
+            if len(new_name) > 0 and new_name != tag.name:
+                existing = Tag.objects.filter(user=request.user, name=new_name).first()
+                if existing is None:
+                    tag.name = new_name
+                    tag.save()
+                else:
+                    # Renaming onto another tag merges both
+                    with transaction.atomic():
+                        existing.documents.add(*tag.documents.all())
+                        tag.delete()
+                    tag = existing
+                suggestion_cache.invalidate(request.user.id)
             return redirect("orgapy:tag", name=tag.name)
 
     return _render_document_list(request,
@@ -1268,10 +1450,7 @@ def view_groceries(request: HttpRequest) -> HttpResponse:
                     item_data["checked"] = False
             settings.groceries_data = json.dumps(data)
             settings.save()
-            try:
-                cat = Tag.objects.get(user=request.user, name="groceries")
-            except Tag.DoesNotExist:
-                cat = Tag.objects.create(user=request.user, name="groceries")
+            cat = _resolve_tags(request.user, ["groceries"])[0]
             old_section = None
             note_content = ""
             for section_label, item_label in items:
@@ -1410,10 +1589,7 @@ def view_objectives(request: HttpRequest) -> HttpResponse:
         settings = _get_or_create_settings(request.user)
         return JsonResponse({
             "startHours": settings.objective_start_hours,
-            "objectives": [
-                objective.to_dict()
-                for objective in qs
-            ]
+            "objectives": evaluate_objectives(qs, settings.objective_start_hours)
         })
 
     objectives = list(qs)
@@ -1435,6 +1611,7 @@ def view_objective(request: HttpRequest, objective_id: str) -> HttpResponse:
         if action == "delete":
             if not request.user.has_perm("orgapy.delete_objective"):
                 raise PermissionDenied()
+            invalidate_objective(objective.id)
             objective.delete()
             return redirect("orgapy:objectives")
 
@@ -1448,9 +1625,7 @@ def view_objective(request: HttpRequest, objective_id: str) -> HttpResponse:
                 ts = int(datetime.datetime.strptime(request.POST["date"] + " " + request.POST["time"], "%Y-%m-%d %H:%M:%S").timestamp())
             else:
                 raise BadRequest("Missing timestamp")
-            history = json.loads(objective.history) if objective.history else []
-            history.append(ts)
-            objective.history = json.dumps(history)
+            ObjectiveCompletion.objects.create(objective=objective, ts=ts)
             ProgressLog.objects.create(
                 user=request.user,
                 type=ProgressLog.OBJECTIVE_COMPLETED,
@@ -1459,9 +1634,10 @@ def view_objective(request: HttpRequest, objective_id: str) -> HttpResponse:
 
         if action == "delete-completion":
             ts = int(request.POST["ts"])
-            history = json.loads(objective.history) if objective.history else []
-            history.remove(ts)
-            objective.history = json.dumps(history)
+            completion = objective.objectivecompletion_set.filter(ts=ts).first()
+            if completion is None:
+                raise BadRequest("Unknown completion")
+            completion.delete()
 
         if action == "save":
             objective.name = request.POST["name"]
@@ -1470,13 +1646,63 @@ def view_objective(request: HttpRequest, objective_id: str) -> HttpResponse:
             objective.archived = request.POST["archived"] == "on"
 
         objective.save()
+        invalidate_objective(objective.id)
 
         if is_ajax:
             return HttpResponse(status=204)
 
+    if request.GET.get("format") == "json":
+        settings = _get_or_create_settings(request.user)
+        return JsonResponse(evaluate_objectives([objective], settings.objective_start_hours)[0])
+
     return render(request, "orgapy/objective.html", {"objective": objective})
 
 
+def _prefix_filter(field: str, prefix: str) -> Q:
+    """Match values starting with `prefix` with a range condition, which,
+    unlike `LIKE`, is answered by a B-tree index."""
+    return Q(**{f"{field}__gte": prefix, f"{field}__lt": prefix + "\U0010ffff"})
+
+
+def _get_suggestions(user: LoggedUser, stype: str, key: str, limit: int) -> list[tuple[list[str], dict]]:
+    """Fetch the objects whose normalized title starts with `key`, most
+    recently accessed or used first, along with the keys they matched on."""
+    if stype in ["document", "note", "sheet", "map"]:
+        qs = Document.objects\
+            .filter(_prefix_filter("title_key", key), user=user, deleted=False, hidden=False)\
+            .order_by("-date_access", "-id")\
+            .only("id", "nonce", "type", "title", "title_key")
+        if stype != "document":
+            qs = qs.filter(type=stype)
+        return [
+            ([doc.title_key], {"ref": doc.nonce, "label": doc.title, "url": doc.get_absolute_url(), "icon": doc.type_icon})
+            for doc in qs[:limit]
+        ]
+    if stype == "tag":
+        qs = _get_tags_with_counts(user, exclude_deleted=True)\
+            .filter(_prefix_filter("name", key))\
+            .order_by("-document_count", "name")
+        return [
+            ([tag.name], {"ref": tag.name, "label": tag.name, "url": tag.get_absolute_url(), "icon": "ri-hashtag"})
+            for tag in qs[:limit]
+        ]
+    if stype == "project":
+        documents = Document.objects.filter(_prefix_filter("title_key", key), user=user).values("id")
+        qs = Project.objects\
+            .filter(user=user)\
+            .filter(_prefix_filter("title_key", key) | Q(document__in=documents))\
+            .select_related("document")\
+            .order_by("-date_modification", "-id")
+        return [
+            (
+                [project.title_key, project.document.title_key if project.document is not None else ""],
+                {"ref": None, "label": project.reference, "url": project.get_absolute_url(), "icon": "ri-briefcase-line"}
+            )
+            for project in qs[:limit]
+        ]
+    raise BadRequest("Invalid suggestion type")
+
+
 @permission_required("orgapy.view_tag")
 @permission_required("orgapy.view_document")
 @permission_required("orgapy.view_project")
@@ -1484,7 +1710,7 @@ def view_suggestions(request: HttpRequest) -> HttpResponse:
     stype = request.GET.get("t", "")
     limit = int(request.GET.get("l", 10))
     query = request.GET.get("q", "").strip()
-    results: list[Tag | Document | Project] = []
+    results: list[dict] = []
     if query:
         if not stype:
             if query.startswith("#"):
@@ -1492,28 +1718,14 @@ def view_suggestions(request: HttpRequest) -> HttpResponse:
                 stype = "tag"
             else:
                 stype = "document"
-        if stype == "document":
-            qs = Document.objects.filter(user=request.user, deleted=False, hidden=False, title__istartswith=query)
-        elif stype in ["note", "sheet", "map"]:
-            qs = Document.objects.filter(user=request.user, deleted=False, hidden=False, type=stype, title__istartswith=query)
-        elif stype == "tag":
-            qs = Tag.objects.filter(user=request.user, name__istartswith=query)
-        elif stype == "project":
-            qs = Project.objects.filter(user=request.user).filter(Q(title__istartswith=query) | Q(document__title__istartswith=query))
-        else:
-            raise BadRequest("Invalid suggestion type")
-        results = list(qs[:limit])
-    return JsonResponse({
-        "results": [
-            {
-                "ref": getattr(result, "name", getattr(result, "nonce", None)),
-                "label": result.title if isinstance(result, Document) else (result.name if isinstance(result, Tag) else result.reference),
-                "url": result.get_absolute_url(),
-                "icon": result.type_icon if isinstance(result, Document) else ("ri-hashtag" if isinstance(result, Tag) else "ri-briefcase-line")
-            }
-            for result in results
-        ]
-    })
+        key = get_title_key(query)
+        cached = suggestion_cache.get(request.user.id, stype, key, limit)
+        if cached is None:
+            suggestions = _get_suggestions(request.user, stype, key, limit)
+            suggestion_cache.set(request.user.id, stype, key, limit, suggestions)
+            cached = [payload for _, payload in suggestions]
+        results = cached
+    return JsonResponse({"results": results})
 
 
 @permission_required("orgapy.view_calendar")
@@ -1538,6 +1750,8 @@ def view_calendars(request: HttpRequest) -> HttpResponse:
             if not request.user.has_perm("orgapy.change_calendar"):
                 raise PermissionDenied()
             calendar = _find_user_object(Calendar, "id", request.POST["id"], request.user)
+            if (calendar.calendar_name, calendar.url, calendar.username) != (request.POST["name"], request.POST["url"], request.POST["username"]):
+                calendar.reset_sync_state()
             calendar.calendar_name = request.POST["name"]
             calendar.url = request.POST["url"]
             calendar.username = request.POST["username"]
@@ -1555,11 +1769,9 @@ def view_calendars(request: HttpRequest) -> HttpResponse:
             if not request.user.has_perm("orgapy.change_calendar"):
                 raise PermissionDenied()
             if "id" in request.POST:
-                calendar = _find_user_object(Calendar, "id", request.POST["id"], request.user)
-                calendar.fetch_events()
+                sync_calendars([_find_user_object(Calendar, "id", request.POST["id"], request.user)], force=True)
             else:
-                for calendar in Calendar.objects.filter(user=request.user):
-                    calendar.fetch_events()
+                sync_calendars(Calendar.objects.filter(user=request.user), force=True)
         
         if "next" in request.POST:
             return redirect(request.POST["next"])